@@ -1,6 +1,9 @@
 # This script will animate PNG files generated by the PSK Reporter plotter scripts into a GIF file.
 # Uncomment the method below you would like to use to create the GIF.
 
+# Faster alternative: pskr-plot-xmldata.py can render the XML files straight into a video without any PNG files, e.g.
+# python pskr-plot-xmldata.py --video ./plots/PSKR-animation.mp4 --width 1920 --fps 12
+
 # Method 1: Using ImageMagick
 #magick convert -delay 20 -loop 0 ./plots/*.png ./plots/PSKR-anmiation.gif
 
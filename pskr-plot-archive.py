@@ -0,0 +1,71 @@
+# pskr-plot-archive.py
+
+# PSK Reporter Signal Reports Plotter
+# This script packs the XML files written by pskr-plot-retrievedata.sh into compressed archive bundles, one per day
+# (or per hour with --period hour). Every capture becomes one gzip member of the bundle for its day and is found again
+# through a small offset index saved next to the bundle, so months of captures take a few hundred files instead of tens
+# of thousands and a fraction of the disk space. The plot scripts and pskr-plot-ingest.py read the bundles the same way
+# as the XML files, nothing else has to change.
+
+# Meant to be run from cron, for example every hour a few minutes after pskr-plot-retrievedata.sh:
+# 7 * * * * cd /path/to/PSKR-Plotter && python pskr-plot-archive.py
+# New bundles are started automatically when the day (or hour) changes. XML files younger than archiveMinAgeMinutes
+# (set in pskrfunctions.py) are left for the next run, they may still be being written.
+# --keep-days N deletes the bundles older than N days.
+
+# A bundle is a normal gzip file, 'zcat pskr-archive-2025-07-01.xml.gz' prints all the captures of that day.
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import pskrfunctions as pskr
+
+# Returns the UTC time a bundle's day or hour ends, None if the file name is not a bundle name
+def get_bundle_end(bundle):
+    period = bundle.name[len('pskr-archive-'):-len('.xml.gz')]
+    try:
+        return datetime.strptime(period, '%Y-%m-%dT%H') + timedelta(hours=1)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(period, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the XML files in the ./pskr-xmldata/ directory into compressed daily or hourly bundles.')
+    parser.add_argument('--period', choices=['day', 'hour'], default=pskr.archivePeriod, help=f'one bundle per day or per hour (default: {pskr.archivePeriod})')
+    parser.add_argument('--min-age', type=float, default=pskr.archiveMinAgeMinutes, help=f'only pack XML files older than this many minutes (default: {pskr.archiveMinAgeMinutes})')
+    parser.add_argument('--level', type=int, choices=range(1, 10), default=pskr.archiveCompressLevel, metavar='1-9', help=f'gzip compression level (default: {pskr.archiveCompressLevel})')
+    parser.add_argument('--keep-days', type=float, help='delete bundles older than this many days')
+    args = parser.parse_args()
+
+    target_dir = Path('./pskr-xmldata/')
+    if not target_dir.is_dir():
+        print("The './pskr-xmldata/' directory does not exist. Run pskr-plot-retrievedata.sh first to capture some reports.")
+        exit(1)
+
+    oldest = time.time() - args.min_age * 60
+    xmlFiles = [xml_file for xml_file in target_dir.glob('*.xml') if xml_file.stat().st_mtime <= oldest]
+    packed = pskr.archive_xml_files(xmlFiles, args.period, args.level)
+    print(f"Packed {packed} XML files into archive bundles.")
+
+    if args.keep_days is not None:
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=args.keep_days)
+        for bundle in sorted(target_dir.glob('pskr-archive-*.xml.gz')):
+            bundleEnd = get_bundle_end(bundle)
+            if bundleEnd is not None and bundleEnd < cutoff:
+                bundle.unlink()
+                pskr.get_archive_index_file(bundle).unlink(missing_ok=True)
+                print(f"Deleted {bundle.name}")
+
+    bundles = list(target_dir.glob('pskr-archive-*.xml.gz'))
+    captures = pskr.get_archived_captures(target_dir)
+    compressedSize = sum(bundle.stat().st_size for bundle in bundles)
+    originalSize = sum(capture.size for capture in captures)
+    print(f"The archive holds {len(captures)} captures in {len(bundles)} bundles, "
+          f"{compressedSize / 2**20:.1f} MB ({originalSize / 2**20:.1f} MB uncompressed).")
+
+if __name__ == '__main__':
+    main()
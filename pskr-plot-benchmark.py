@@ -0,0 +1,381 @@
+# pskr-plot-benchmark.py
+
+# PSK Reporter Signal Reports Plotter
+# This script measures how fast the plotter is, offline, on synthetic PSK Reporter data. It writes a set of realistic
+# receptionReports XML files to a temporary directory and times each stage of plotting them (XML parsing, reading the
+# report attributes, Maidenhead locator conversion, projecting and plotting the signal paths, nightshade, saving the PNG)
+# as well as the full pskr-plot-xmldata.py (one plot per file) and pskr-plot-xmldata-all.py (all files in one plot) runs.
+# Use it to check a change did not make plotting slower, or to see how many reports a machine can keep up with.
+# Requires the 'numpy', 'matplotlib', and 'cartopy' libraries. Nothing is fetched from PSK Reporter.
+
+# Every scenario is run --repeat times, the best and median times are shown with the throughput of the best run in
+# reports per second (and frames per second for the scenarios that save plots). The peak memory of each scenario is
+# measured with tracemalloc in one extra run, which is left out of the timings.
+
+# Usage: python pskr-plot-benchmark.py [--reports N] [--files N] [--locators N] [--bands 20m:35,40m:20] [--repeat N]
+# --reports is the number of reports per file, --locators the number of different sender grid squares and --bands the
+# band mix as band:weight pairs. --scenario runs only the named scenarios (can be repeated), --json FILE adds the results
+# as one line to FILE so runs can be compared later.
+# --render-profile, --size and --format time the plots with another render profile, e.g. --render-profile preview.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import numpy as np
+import matplotlib
+from matplotlib import pyplot as plt
+import cartopy
+import pskrfunctions as pskr
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory of the whole run is not shown there
+    resource = None
+
+# FT8 dial frequency of each band, the synthetic reports are spread over the 3 kHz above it
+ft8DialFrequencies = {
+    '6m': 50313000, '10m': 28074000, '12m': 24915000, '15m': 21074000, '17m': 18100000,
+    '20m': 14074000, '30m': 10136000, '40m': 7074000, '80m': 3573000, '160m': 1840000,
+}
+defaultBandMix = '20m:35,40m:20,15m:12,10m:10,17m:8,30m:6,80m:5,12m:2,6m:1,160m:1'
+
+# Areas where most senders are, as (longitude, latitude, spread in degrees, share of the senders).
+# The rest of the senders are spread evenly over the world.
+senderHotspots = [
+    (10, 50, 8, 0.35),    # Europe
+    (-90, 38, 12, 0.25),  # North America
+    (138, 36, 4, 0.08),   # Japan
+    (145, -32, 6, 0.04),  # Australia
+    (-50, -20, 8, 0.04),  # South America
+]
+
+Scenario = namedtuple('Scenario', ['name', 'setup', 'run', 'reports', 'frames'])
+
+# Returns the Maidenhead locators (4 or 6 characters) of arrays of longitude/latitude
+def encode_locators(lons, lats, length=6):
+    lons = np.clip(np.asarray(lons, dtype=float) + 180, 0, 359.999999)
+    lats = np.clip(np.asarray(lats, dtype=float) + 90, 0, 179.999999)
+    fieldLon, fieldLat = (lons // 20).astype(int), (lats // 10).astype(int)
+    squareLon, squareLat = (lons % 20 // 2).astype(int), (lats % 10).astype(int)
+    subLon, subLat = (lons % 2 * 12).astype(int), (lats % 1 * 24).astype(int)
+    locators = []
+    for row in range(len(lons)):
+        locator = f"{chr(65 + fieldLon[row])}{chr(65 + fieldLat[row])}{squareLon[row]}{squareLat[row]}"
+        if length >= 6:
+            locator += f"{chr(97 + subLon[row])}{chr(97 + subLat[row])}"
+        locators.append(locator)
+    return locators
+
+# Returns count random locators, most of them in the senderHotspots areas
+def random_locators(rng, count, length=6):
+    lons = rng.uniform(-180, 180, count)
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, count)))
+    hotspot = rng.random(count)
+    share = 0
+    for lon, lat, spread, hotspotShare in senderHotspots:
+        inHotspot = (hotspot >= share) & (hotspot < share + hotspotShare)
+        lons[inHotspot] = rng.normal(lon, spread * 1.5, inHotspot.sum())
+        lats[inHotspot] = rng.normal(lat, spread, inHotspot.sum())
+        share += hotspotShare
+    return encode_locators(((lons + 180) % 360) - 180, np.clip(lats, -89.9, 89.9), length)
+
+# Parses a band mix like '20m:35,40m:20,15m' into a list of band names and a list of weights (1 when left out)
+def parse_band_mix(bandMix):
+    bands, weights = [], []
+    for entry in bandMix.split(','):
+        band, _, weight = entry.strip().partition(':')
+        pskr.get_band_index(band)
+        if band.strip().lower() not in ft8DialFrequencies:
+            raise ValueError(f"No FT8 frequency known for band {band}.")
+        bands.append(band.strip().lower())
+        weights.append(float(weight) if weight else 1.0)
+    return bands, np.array(weights) / sum(weights)
+
+# Writes fileCount synthetic PSK Reporter captures, 5 minutes apart, to the directory and returns their paths.
+# Each file holds reportCount reports on the given band mix from senderLocatorCount different grid squares, received
+# by receiverCount stations (the first one is myCallsign/myLocator). A share of incomplete reports without a sender
+# locator is mixed in, like the real API returns.
+def write_synthetic_captures(directory, fileCount, reportCount, bandMix=defaultBandMix, senderLocatorCount=2000,
+                             receiverCount=1, incompleteShare=0.02, seed=1):
+    rng = np.random.default_rng(seed)
+    bands, weights = parse_band_mix(bandMix)
+    senderLocators = random_locators(rng, senderLocatorCount, 4)
+    receivers = [(pskr.myCallsign, pskr.myLocator)] + [(f"N{number}TST", locator) for number, locator in
+                                                       enumerate(random_locators(rng, receiverCount - 1), start=1)]
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    startTime = datetime(2025, 7, 1, 12, 0, 0)
+
+    xmlFiles = []
+    for fileNumber in range(fileCount):
+        captureTime = startTime + timedelta(minutes=5 * fileNumber)
+        captureSeconds = pskr.datetime_to_seconds(captureTime)
+        reportBands = rng.choice(len(bands), size=reportCount, p=weights)
+        offsets = rng.integers(200, 3000, reportCount)
+        snrs = np.clip(np.round(rng.normal(-10, 7, reportCount)), -28, 25).astype(int)
+        senders = rng.integers(0, senderLocatorCount, reportCount)
+        receiverRows = rng.integers(0, len(receivers), reportCount)
+        incomplete = rng.random(reportCount) < incompleteShare
+
+        lines = ['<?xml version="1.0"?>', f'<receptionReports currentSeconds="{captureSeconds}">',
+                 f'<activeReceiver callsign="{pskr.myCallsign}" locator="{pskr.myLocator}" frequency="14074000" '
+                 'region="" DXCC="United States" decoderSoftware="WSJT-X" antennaInformation="" mode="FT8" />',
+                 f'<lastSequenceNumber value="{fileNumber * reportCount}" />',
+                 f'<maxFlowStartSeconds value="{captureSeconds - 60}" />']
+        for row in range(reportCount):
+            receiverCallsign, receiverLocator = receivers[receiverRows[row]]
+            senderLocator = '' if incomplete[row] else senderLocators[senders[row]]
+            lines.append(f'<receptionReport receiverCallsign="{receiverCallsign}" receiverLocator="{receiverLocator}" '
+                         f'senderCallsign="S{senders[row]}TST" senderLocator="{senderLocator}" '
+                         f'frequency="{ft8DialFrequencies[bands[reportBands[row]]] + offsets[row]}" '
+                         f'flowStartSeconds="{captureSeconds - 300 + row * 300 // reportCount}" mode="FT8" isSender="1" '
+                         f'senderDXCC="Synthetic" senderDXCCCode="TST" senderDXCCLocator="{senderLocators[senders[row]][:2]}" sNR="{snrs[row]}" />')
+        lines.append('</receptionReports>')
+
+        xml_file = directory / f"pskr-retrievedata-{pskr.format_datetime(captureTime, 'file')}.xml"
+        xml_file.write_text('\n'.join(lines) + '\n')
+        xmlFiles.append(xml_file)
+    return xmlFiles
+
+# Reads the complete reports of the XML files once, the input of the locator and path scenarios
+def read_report_columns(xmlFiles):
+    frequencies, snrs, senderLocators, receiverLocators = [], [], [], []
+    for report in pskr.iter_xml_reports(xmlFiles):
+        callsign, frequency, senderLocator, receiverLocator, signal_strength = pskr.get_report_attributes(report)
+        if pskr.is_complete_report(callsign, frequency, senderLocator, receiverLocator, signal_strength):
+            frequencies.append(frequency)
+            snrs.append(signal_strength)
+            senderLocators.append(senderLocator)
+            receiverLocators.append(receiverLocator)
+    return frequencies, snrs, senderLocators, receiverLocators
+
+# Draws every XML file into one plot like pskr-plot-xmldata-all.py and saves it
+def plot_merged_captures(outputFile, dpi):
+    records, index = pskr.query_reports()
+    captureDatetime = pskr.seconds_to_datetime(max(capture['time'] for capture in index['captures']))
+    ax = pskr.setup_plot(reuseFigure=True, dpi=dpi)
+    pskr.plot_report_records(ax, records, index)
+    pskr.add_nightshade(ax, captureDatetime)
+    pskr.add_title_and_text(plt, ax, captureDatetime)
+    pskr.save_figure_atomic(ax.figure, outputFile, **pskr.get_savefig_kwargs(ax.figure))
+
+# Returns the benchmark scenarios for the XML files, in the order they run.
+# setup() runs untimed before every repeat and returns the argument passed to run().
+def build_scenarios(xmlFiles, dpi):
+    projection = pskr.set_map_projection()
+    reportCount = sum(1 for _ in pskr.iter_xml_reports(xmlFiles))
+    frequencies, snrs, senderLocators, receiverLocators = read_report_columns(xmlFiles)
+    completeCount = len(frequencies)
+    firstFileReports = sum(1 for _ in pskr.iter_xml_reports(xmlFiles[:1]))
+    captureTimes = [pskr.get_time_from_xml(xml_file) for xml_file in xmlFiles]
+
+    def coords():
+        return pskr.get_lat_lon_from_locators(senderLocators), pskr.get_lat_lon_from_locators(receiverLocators)
+
+    def clear_locator_cache():
+        pskr.locatorCache.clear()
+
+    def cold_great_circles():
+        pskr.greatCircleCache.clear()
+        return coords()
+
+    def fresh_plot():
+        ax = pskr.setup_plot(reuseFigure=True, dpi=dpi)
+        senderCoords, receiverCoords = coords()
+        # Project the paths up front so only the plotting is timed
+        pskr.get_great_circle_paths(projection, senderLocators, receiverLocators, senderCoords, receiverCoords)
+        return ax, senderCoords, receiverCoords
+
+    def plot_paths(state):
+        ax, senderCoords, receiverCoords = state
+        pskr.plot_signal_paths(ax, senderCoords, receiverCoords, frequencies, snrs, senderLocators, receiverLocators)
+        pskr.plot_qth_locators(ax, receiverCoords)
+
+    def nightshade_plot(clear):
+        def setup():
+            if clear:
+                pskr.nightshadeCache.clear()
+            return pskr.setup_plot(reuseFigure=True, dpi=dpi)
+        return setup
+
+    def add_nightshades(ax):
+        for captureTime in captureTimes:
+            pskr.add_nightshade(ax, captureTime)
+
+    def drawn_frame():
+        reports = pskr.parse_xml_file(xmlFiles[0]).findall('.//receptionReport')
+        return pskr.draw_reports_frame(reports, captureTimes[0], verbose=False, dpi=dpi)
+
+    def plot_each_file(_):
+        for xml_file in xmlFiles:
+            pskr.plot_xml_file(xml_file, verbose=False)
+
+    return [
+        Scenario('parse_xml_file', lambda: None, lambda _: [pskr.parse_xml_file(xml_file) for xml_file in xmlFiles], reportCount, 0),
+        Scenario('parse_xml_files', lambda: None, lambda _: pskr.parse_xml_files(xmlFiles), reportCount, 0),
+        Scenario('iter_xml_reports', lambda: None, lambda _: sum(1 for _ in pskr.iter_xml_reports(xmlFiles)), reportCount, 0),
+        Scenario('report_attributes', lambda: pskr.parse_xml_files(xmlFiles).findall('receptionReport'),
+                 lambda reports: [pskr.get_report_attributes(report) for report in reports], reportCount, 0),
+        Scenario('locators_scalar', clear_locator_cache,
+                 lambda _: [pskr.get_lat_lon_from_locator(locator) for locator in senderLocators + receiverLocators], completeCount, 0),
+        Scenario('locators_vector', clear_locator_cache, lambda _: coords(), completeCount, 0),
+        Scenario('great_circles_cold', cold_great_circles,
+                 lambda state: pskr.get_great_circle_paths(projection, senderLocators, receiverLocators, *state), completeCount, 0),
+        Scenario('plot_paths', fresh_plot, plot_paths, completeCount, 0),
+        Scenario('nightshade_cold', nightshade_plot(True), add_nightshades, 0, len(xmlFiles)),
+        Scenario('nightshade_warm', nightshade_plot(False), add_nightshades, 0, len(xmlFiles)),
+        Scenario('savefig', drawn_frame,
+                 lambda ax: pskr.save_figure_atomic(ax.figure, f'./plots/benchmark-savefig.{pskr.outputFormat}', **pskr.get_savefig_kwargs(ax.figure)), firstFileReports, 1),
+        Scenario('pipeline_single', lambda: None, plot_each_file, reportCount, len(xmlFiles)),
+        Scenario('pipeline_merge_all', lambda: None, lambda _: plot_merged_captures(f'./plots/benchmark-merged.{pskr.outputFormat}', dpi), reportCount, 1),
+    ]
+
+# Runs one scenario repeat times and returns its results. The console output of the plot functions is hidden so
+# printing is not part of the timings.
+def run_scenario(scenario, repeat, measureMemory):
+    wallTimes, cpuTimes = [], []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = scenario.setup()
+            wallStart, cpuStart = time.perf_counter(), time.process_time()
+            scenario.run(state)
+            wallTimes.append(time.perf_counter() - wallStart)
+            cpuTimes.append(time.process_time() - cpuStart)
+
+    peakMemory = None
+    if measureMemory:
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = scenario.setup()
+            tracemalloc.start()
+            scenario.run(state)
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    best = min(wallTimes)
+    return {
+        'scenario': scenario.name,
+        'best_s': round(best, 6),
+        'median_s': round(float(np.median(wallTimes)), 6),
+        'cpu_s': round(cpuTimes[wallTimes.index(best)], 6),
+        'reports': scenario.reports,
+        'frames': scenario.frames,
+        'reports_per_s': round(scenario.reports / best, 1) if scenario.reports else None,
+        'frames_per_s': round(scenario.frames / best, 3) if scenario.frames else None,
+        'peak_memory_mb': round(peakMemory / 2**20, 1) if peakMemory is not None else None,
+    }
+
+# Returns the peak resident memory of this process in MB, None where it cannot be read
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+def print_results(results):
+    print(f"{'scenario':<20} {'best s':>9} {'median s':>9} {'cpu s':>9} {'reports/s':>11} {'frames/s':>9} {'peak MB':>8}")
+    for result in results:
+        reportsPerSecond = f"{result['reports_per_s']:.0f}" if result['reports_per_s'] is not None else '-'
+        framesPerSecond = f"{result['frames_per_s']:.2f}" if result['frames_per_s'] is not None else '-'
+        peakMemory = f"{result['peak_memory_mb']:.1f}" if result['peak_memory_mb'] is not None else '-'
+        print(f"{result['scenario']:<20} {result['best_s']:>9.3f} {result['median_s']:>9.3f} {result['cpu_s']:>9.3f} "
+              f"{reportsPerSecond:>11} {framesPerSecond:>9} {peakMemory:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Time each plotting stage on synthetic PSK Reporter captures.')
+    parser.add_argument('--reports', type=int, default=2000, help='reception reports per XML file (default: 2000)')
+    parser.add_argument('--files', type=int, default=6, help='number of XML files, 5 minutes apart (default: 6)')
+    parser.add_argument('--locators', type=int, default=2000, help='number of different sender grid squares (default: 2000)')
+    parser.add_argument('--receivers', type=int, default=1, help='number of receiving stations (default: 1, your own)')
+    parser.add_argument('--bands', default=defaultBandMix, help=f'band mix as band:weight pairs (default: {defaultBandMix})')
+    parser.add_argument('--incomplete', type=float, default=0.02, help='share of reports without a sender locator (default: 0.02)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed, the same seed writes the same files (default: 1)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each scenario (default: 3)')
+    parser.add_argument('--dpi', type=float, help='plot resolution (default: that of the render profile)')
+    parser.add_argument('--scenario', action='append', help='only run this scenario (can be repeated)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run of each scenario')
+    parser.add_argument('--json', help='append the settings and results as one JSON line to this file')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary directory with the XML files and plots')
+    pskr.add_render_arguments(parser)
+    args = parser.parse_args()
+
+    if args.reports < 1 or args.files < 1 or args.locators < 1 or args.receivers < 1 or args.repeat < 1:
+        print("--reports, --files, --locators, --receivers and --repeat must be at least 1.")
+        exit(1)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    # The plot functions read and write relative to the current directory, so the whole run happens in a temporary
+    # directory with its own caches. The saved great circle and nightshade caches are left alone.
+    workDir = tempfile.mkdtemp(prefix='pskr-benchmark-')
+    startDir = os.getcwd()
+    pskr.greatCircleCacheFile = None
+    pskr.nightshadeCacheFile = None
+    # The pipeline scenarios save with the render profile like the plot scripts do, --dpi overrides its resolution
+    pskr.apply_render_arguments(args)
+    if args.dpi is not None:
+        pskr.outputDpi = args.dpi
+    args.dpi = pskr.get_output_dpi()
+    try:
+        os.chdir(workDir)
+        Path('./plots').mkdir()
+        try:
+            xmlFiles = write_synthetic_captures('./pskr-xmldata', args.files, args.reports, args.bands, args.locators,
+                                                args.receivers, args.incomplete, args.seed)
+        except ValueError as e:
+            print(e)
+            exit(1)
+        print(f"Wrote {args.files} XML files with {args.reports} reports each to {workDir}")
+
+        scenarios = build_scenarios(xmlFiles, args.dpi)
+        if args.scenario:
+            unknown = set(args.scenario) - {scenario.name for scenario in scenarios}
+            if unknown:
+                print(f"Unknown scenario: {', '.join(sorted(unknown))}. Use one of: {', '.join(scenario.name for scenario in scenarios)}")
+                exit(1)
+            scenarios = [scenario for scenario in scenarios if scenario.name in args.scenario]
+
+        # The basemap is drawn once per run in real use too, keep it out of the timings
+        print("Rendering the basemap...")
+        pskr.warm_render_caches(args.dpi)
+
+        results = []
+        for scenario in scenarios:
+            print(f"Running {scenario.name}...")
+            results.append(run_scenario(scenario, args.repeat, not args.no_memory))
+    finally:
+        os.chdir(startDir)
+        if args.keep:
+            print(f"Kept {workDir}")
+        else:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    print()
+    print_results(results)
+    peakRss = get_peak_rss_mb()
+    if peakRss is not None:
+        print(f"Peak resident memory of the run: {peakRss:.1f} MB")
+
+    if args.json:
+        settings = {name: getattr(args, name) for name in ('reports', 'files', 'locators', 'receivers', 'bands', 'incomplete', 'seed', 'repeat', 'dpi', 'render_profile', 'size', 'format')}
+        environment = {'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': matplotlib.__version__,
+                       'cartopy': cartopy.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count(), 'system': platform.system()}
+        with open(args.json, 'a') as file:
+            file.write(json.dumps({'time': pskr.format_datetime(datetime.now(timezone.utc), 'file'), 'settings': settings, 'environment': environment,
+                                   'results': results, 'peak_rss_mb': peakRss}) + '\n')
+        print(f"Results added to {args.json}")
+
+if __name__ == '__main__':
+    main()
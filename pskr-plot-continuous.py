@@ -0,0 +1,108 @@
+# pskr-plot-continuous.py
+
+# PSK Reporter Signal Reports Plotter
+# This script fetches signal reports from PSK Reporter and plots them on a world map using Cartopy and Matplotlib.
+# It visualizes the signal paths and reception reports based on frequency bands.
+# Requires the 'requests', 'numpy', 'matplotlib', and 'cartopy' libraries.
+
+# This is the continuous version of the script, it keeps running and fetches signal reports from the PSK Reporter API
+# every pollInterval seconds (set in pskrfunctions.py, never less than 5 minutes), saving one plot per fetch.
+# The figure, basemap and locator/great circle caches stay loaded between fetches, so each plot only costs the fetch and
+# the signal layers. It does not use the XML files created by the pskr-plot-retrievedata.sh helper script.
+# With several stations in myStations the reports of all of them are fetched in each cycle over the same connection, one
+# plot is saved per station. --save-xml also saves every fetch as an XML file in './pskr-xmldata/', so the other scripts
+# and pskr-plot-archive.py can use them without running pskr-plot-retrievedata.sh as well.
+# --render-profile preview|standard|archival, --size WxH (e.g. 1920x1080) and --format png|webp|jpg set the resolution,
+# coastlines and image format of the plots, preview renders in a fraction of the time. The profiles are set in pskrfunctions.py.
+# Stop it with CTRL+C or a kill signal (SIGTERM), the plot in progress is finished before it exits.
+# Every fetch adds one line to the run statistics file set in pskrfunctions.py. --cprofile FILE profiles every
+# fetch and plot cycle and --tracemalloc the whole time the script runs, the results are shown when it stops.
+
+# The script requires the directory './plots/' to be created in the same directory as this script to save the output plot.
+
+import argparse
+import asyncio
+import signal
+import requests
+from datetime import datetime, timezone
+import pskrfunctions as pskr
+
+# PSK Reporter asks for no more than one request every 5 minutes
+minimumPollInterval = 300
+
+# Fetches the latest reports of every station and saves the plots of them, returns the file names of the plots.
+# With saveXml the fetched reports are also saved as a capture XML file for the other scripts.
+def fetch_and_plot(session, saveXml=False):
+    pskr.reset_run_stats()
+    current_date = datetime.now(timezone.utc)
+    reports = pskr.getStationReports(session)
+    receptionReports = reports.findall('.//receptionReport')
+    print(f"{pskr.format_datetime(current_date, 'console')} Fetched {len(receptionReports)} reception reports.")
+    if saveXml:
+        print(f"Reports saved as {pskr.save_capture_xml(reports, current_date)}")
+
+    outputFiles = pskr.plot_station_frames(receptionReports, current_date, verbose=False)
+
+    # Keep the projected signal paths and nightshade in case the script is killed without warning
+    pskr.save_render_caches()
+    pskr.write_run_stats('pskr-plot-continuous.py', reports=len(receptionReports))
+    return outputFiles
+
+# Runs one fetch and plot cycle. It runs in a worker thread, which cProfile only sees when it is enabled in that thread.
+def run_cycle(session, saveXml=False):
+    with pskr.profiled():
+        return fetch_and_plot(session, saveXml)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Fetch the latest reports from PSK Reporter and plot them every pollInterval seconds until stopped.')
+    parser.add_argument('--save-xml', action='store_true', help="also save every fetch as an XML file in './pskr-xmldata/', instead of running pskr-plot-retrievedata.sh")
+    pskr.add_render_arguments(parser)
+    pskr.add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    pskr.apply_render_arguments(args)
+
+    # Check if the required user configuration is set
+    pskr.check_user_config()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signalNumber in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signalNumber, stop.set)
+
+    interval = max(pskr.pollInterval, minimumPollInterval)
+    print("Loading the map...")
+    pskr.warm_render_caches()
+
+    session = pskr.create_http_session()
+    pskr.start_profiling(args.cprofile, args.tracemalloc, enable=False)
+    print(f"Fetching reports every {interval} seconds, press CTRL+C to stop.")
+    nextPoll = loop.time()
+    try:
+        while not stop.is_set():
+            try:
+                # Fetching and plotting run in a thread so a signal can still be handled while they are busy
+                outputFiles = await asyncio.to_thread(run_cycle, session, args.save_xml)
+                for outputFile in outputFiles:
+                    print(f"Plot saved as {outputFile}")
+            except requests.RequestException as e:
+                print(f"Could not fetch reports from PSK Reporter: {e}")
+            except Exception as e:
+                # Keep running, the next fetch may work
+                print(f"Could not plot the reports: {type(e).__name__}: {e}")
+
+            # Poll on a fixed schedule, if a cycle took longer than the interval wait a full interval from now
+            nextPoll += interval
+            if nextPoll < loop.time():
+                nextPoll = loop.time() + interval
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=nextPoll - loop.time())
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        session.close()
+        pskr.save_render_caches()
+        pskr.stop_profiling()
+        print("Stopped.")
+
+if __name__ == '__main__':
+    asyncio.run(main())
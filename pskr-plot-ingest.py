@@ -0,0 +1,30 @@
+# pskr-plot-ingest.py
+
+# PSK Reporter Signal Reports Plotter
+# This script converts the XML files in the './pskr-xmldata/' directory into the columnar report store in './pskr-store/'.
+# Each report is stored as a fixed size row (callsign ids, frequency, SNR, decoded longitude/latitude and times) so the
+# plot scripts can load them straight from disk with the --store option instead of parsing the XML files again.
+# Requires the 'numpy' library.
+
+# Files that were already ingested are skipped, so it is safe to run this from cron right after pskr-plot-retrievedata.sh.
+# Files that changed since they were ingested are read again, files that cannot be parsed are tried again on the next run.
+# --cprofile FILE and --tracemalloc profile the run, the time spent in each stage is always added to the run statistics file.
+
+import argparse
+import pskrfunctions as pskr
+
+parser = argparse.ArgumentParser(description='Add the XML files in the ./pskr-xmldata/ directory to the report store.')
+pskr.add_instrumentation_arguments(parser)
+args = parser.parse_args()
+pskr.start_profiling(args.cprofile, args.tracemalloc)
+
+xmlFiles = pskr.get_xml_files()
+
+if not xmlFiles:
+    print("No XML files found in the './pskr-xmldata/' directory. Please ensure the directory exists and contains XML files.")
+    exit(1)
+
+added = pskr.ingest_xml_files(xmlFiles)
+index = pskr.load_report_store_index()
+print(f"Added {added} reports, the report store now holds {len(index['captures'])} captures.")
+pskr.write_run_stats('pskr-plot-ingest.py', **pskr.stop_profiling(), added=added, captures=len(index['captures']))
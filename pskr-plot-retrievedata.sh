@@ -9,8 +9,13 @@
 # Example 1 hour cron job:
 # 0 * * * * /bin/bash /path/to/pskr-plot-retrievedata.sh
 
+# The XML files pile up quickly, pack them into daily compressed bundles with pskr-plot-archive.py, e.g. every hour:
+# 7 * * * * cd /path/to && python pskr-plot-archive.py
+
 # User-defined variables
 # Set your callsign here
+# This script fetches one callsign. To capture several stations, set myStations in pskrfunctions.py and run
+# 'python pskr-plot-continuous.py --save-xml' instead, it fetches them all in each cycle and saves one XML file per cycle.
 callsign="YOUR_CALLSIGN"
 
 # Set the time resolution here (in NEGATIVE seconds) for the PSK Reporter query, default is -300 seconds (5 minutes)
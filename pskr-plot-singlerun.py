@@ -3,17 +3,29 @@
 # PSK Reporter Signal Reports Plotter
 # This script fetches signal reports from PSK Reporter and plots them on a world map using Cartopy and Matplotlib.
 # It visualizes the signal paths and reception reports based on frequency bands.
-# Requires the 'requests', 'maidenhead', 'matplotlib', and 'cartopy' libraries.
+# Requires the 'requests', 'numpy', 'matplotlib', and 'cartopy' libraries.
 
 # This is the single run version of the script, it retrieves signal reports from the PSK Reporter API directly. 
 # DO NOT RUN THIS SCRIPT MORE THAN ONCE EVERY 5 MINUTES TO AVOID RATE LIMITS!
 # The script requires the directory './plots/' to be created in the same directory as this script to save the output plot.
+# With several stations in myStations the reports of every station are fetched and one plot is saved per station.
+# --render-profile preview|standard|archival, --size WxH (e.g. 1920x1080) and --format png|webp|jpg set the resolution,
+# coastlines and image format of the plots, preview renders in a fraction of the time. The profiles are set in pskrfunctions.py.
+# --cprofile FILE and --tracemalloc profile the run, the time spent in each stage is always added to the run statistics file.
 
 
 from matplotlib import pyplot as plt
 from datetime import datetime, timezone
+import argparse
 import pskrfunctions as pskr
 
+parser = argparse.ArgumentParser(description='Fetch the latest reports from PSK Reporter and plot them onto one PNG file.')
+pskr.add_render_arguments(parser)
+pskr.add_instrumentation_arguments(parser)
+args = parser.parse_args()
+pskr.apply_render_arguments(args)
+pskr.start_profiling(args.cprofile, args.tracemalloc)
+
 current_date = datetime.now(timezone.utc)
 
 # Check if the required user configuration is set
@@ -22,56 +34,39 @@ pskr.check_user_config()
 ### Set up Cartopy Map Options ###
 
 projection = pskr.set_map_projection() # You can set the map projection to something else if you prefer in pskrfunctions.py
-# Nightshade parameters, current_date is required. alpha and facecolor override the defaults.
-nightshade = pskr.cnightshade(date=current_date, alpha=0.2, facecolor='black')
-
-# Set up plot, you can customize these in pskrfunctions.py
-ax = pskr.setup_plot(pskr.coastlineBorderResolution, pskr.coastlineBorderWidth, pskr.countrylineBorderWidth)
 
-# Add nightshade to the plot
-ax.add_feature(nightshade)
+# Get signal reports from PSK Reporter, one request per station in myStations
 
-# Get signal reports from PSK Reporter
-
-reports = pskr.getSignalReports()
+reports = pskr.getStationReports()
 #print(ET.tostring(reports, encoding='unicode')) # For debugging
 
 receptionReports = reports.findall('.//receptionReport')
 #print(receptionReports) # For debugging
 
-# Main plotting loop, plots each reception report on the map
-for report in receptionReports:
-
-    # Get the attributes from the a single reception report
-    callsign, frequency, senderLocator, receiverLocator, signal_strength = pskr.get_report_attributes(report)
-    
-    if not (callsign and frequency and senderLocator and receiverLocator and signal_strength):
-        print("Skipping incomplete report.") # Print an exclamation mark if any of the attributes are missing
-        continue # If any atributes are missing, skip plotting this report
-    else: 
-        # Convert Maidenhead locator to longitude and latitude (This order is important for plotting)
-        coords = pskr.get_lat_lon_from_locator(senderLocator)
-        QTHcoords = pskr.get_lat_lon_from_locator(receiverLocator)
-
-        # Convert Maidenhead locator to longitude and latitude (This order is imprortant for plotting)
-        coords = pskr.get_lat_lon_from_locator(senderLocator)
-        # Convert configured QTH locator to latitude and longitude
-        QTHcoords = pskr.get_lat_lon_from_locator(receiverLocator)
-
-        # Status output
-        print(f"Callsign: {callsign}, Locator: {senderLocator}, Coordinates: {coords}, SNR: {signal_strength}")
-        print("Adding to map...")
-    
-        # Plot the signal path and QTH locator on the map
-        pskr.plot_signal_path(ax, coords, QTHcoords, frequency, signal_strength)
-        pskr.plot_qth_locator(ax, QTHcoords)
-    
-# Add title and text to the plot
-pskr.add_title_and_text(plt, ax, current_date)
-
-# Save the plot to the './plots/' directory with a timestamp
-plt.savefig(f"./plots/psk_reporter_signal_reports.{pskr.format_datetime(current_date,'file')}.png", bbox_inches='tight', dpi=300)
-print(f"Plot saved as psk_reporter_signal_reports.{pskr.format_datetime(current_date,'file')}.png")
+# One plot per station when several stations are configured, otherwise a single plot with all the reports
+for station, stationReports in pskr.split_reports_by_station(receptionReports):
+    # Set up plot, you can customize these in pskrfunctions.py. The figure and basemap are reused for every station.
+    ax = pskr.setup_plot(pskr.coastlineBorderResolution, pskr.coastlineBorderWidth, pskr.countrylineBorderWidth, reuseFigure=True)
+
+    # Add nightshade to the plot, current_date is required. alpha and facecolor override the defaults.
+    pskr.add_nightshade(ax, current_date, alpha=0.2, facecolor='black')
+
+    # Main plotting loop, reads each reception report and plots all the signal paths and the QTH locator on the map in one batch.
+    # Incomplete reports are skipped. Set printEachReport in pskrfunctions.py to print every report as it is read.
+    plotted, skipped = pskr.plot_reception_reports(ax, stationReports)
+
+    # Add title and text to the plot
+    pskr.add_title_and_text(plt, ax, current_date, station)
+
+    # Save the plot to the './plots/' directory with a timestamp, and the callsign when several stations are plotted
+    outputFile = pskr.get_plot_filename(current_date, station)
+    with pskr.stage_timer('savefig'):
+        plt.savefig(outputFile, **pskr.get_savefig_kwargs(ax.figure))
+    print(f"Plot saved as {outputFile}")
+
+# Keep the projected signal paths and nightshade for the next run
+pskr.save_render_caches()
+pskr.write_run_stats('pskr-plot-singlerun.py', **pskr.stop_profiling(), reports=len(receptionReports))
 
 # If you want to show the plot, uncomment the next line however this will block the script until you close the plot window.
 #plt.show()
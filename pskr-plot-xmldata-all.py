@@ -3,21 +3,49 @@
 # PSK Reporter Signal Reports Plotter
 # This script fetches signal reports from PSK Reporter and plots them on a world map using Cartopy and Matplotlib.
 # It visualizes the signal paths and reception reports based on frequency bands.
-# Requires the 'requests', 'maidenhead', 'matplotlib', and 'cartopy' libraries.
+# Requires the 'requests', 'numpy', 'matplotlib', and 'cartopy' libraries.
 
 # This is the 'batch' version of the script, however it plots ALL of the XML files in the './pskr-xmldata/' directory at once.
+# With several stations in myStations one plot is saved per station, with the callsign in the file name.
 # Note: This uses the last XML file's datetime for the nightshade shading, so it is recommended to run this script after the XML files have been updated.
-# If you would like to disable this, comment out the line: ax.add_feature(nightshade)
+# If you would like to disable this, comment out the line: pskr.add_nightshade(ax, xml_datetime)
 
 # DO NOT RUN THIS SCRIPT MORE THAN ONCE EVERY 5 MINUTES TO AVOID RATE LIMITS!
 # The script requires the directory './plots/' to be created in the same directory as this script to save the output plot.
 
+# The reports can be narrowed down, only the XML files captured in the requested time range are opened. For example the last 6 hours on 20m only:
+# python pskr-plot-xmldata-all.py --hours 6 --band 20m
+# Other options: --start/--end (UTC, e.g. 2025-07-01T12:00), --min-snr, --callsign (sender, can be repeated), --band can also be repeated.
+# For weeks of data use --heatmap count (or best/median for the SNR) to draw a heatmap of grid squares instead of every signal path.
+# --render-profile preview|standard|archival, --size WxH (e.g. 1920x1080) and --format png|webp|jpg set the resolution,
+# coastlines and image format of the plots, preview renders in a fraction of the time. The profiles are set in pskrfunctions.py.
+# --cprofile FILE and --tracemalloc profile the run, the time spent in each stage is always added to the run statistics file.
+
 
 from matplotlib import pyplot as plt
+from datetime import datetime, timedelta, timezone
+import argparse
 import pskrfunctions as pskr
 
-# Get current date and time in UTC
-#current_date = datetime.now(timezone.utc) #Not used in future version of this script, the date is derived from the XML file name.
+parser = argparse.ArgumentParser(description='Plot the reception reports in the ./pskr-xmldata/ directory onto one PNG file.')
+parser.add_argument('--store', action='store_true', help='read the reports from the report store filled by pskr-plot-ingest.py instead of the XML files')
+parser.add_argument('--start', type=pskr.parse_utc_datetime, help='only plot captures from this UTC date/time on, e.g. 2025-07-01T12:00, an offset like +02:00 is converted to UTC')
+parser.add_argument('--end', type=pskr.parse_utc_datetime, help='only plot captures up to this UTC date/time')
+parser.add_argument('--hours', type=float, help='only plot captures from the last HOURS hours, overrides --start')
+parser.add_argument('--band', action='append', type=pskr.parse_band, help='only plot this band, e.g. 20m (can be repeated)')
+parser.add_argument('--min-snr', type=int, help='only plot reports with at least this SNR in dB')
+parser.add_argument('--callsign', action='append', help='only plot reports from this sender callsign (can be repeated)')
+parser.add_argument('--heatmap', choices=['count', 'best', 'median'], help='draw a heatmap of the report count, best SNR or median SNR per grid square instead of the signal paths')
+pskr.add_render_arguments(parser)
+pskr.add_instrumentation_arguments(parser)
+args = parser.parse_args()
+pskr.apply_render_arguments(args)
+pskr.start_profiling(args.cprofile, args.tracemalloc)
+
+# Get current date and time in UTC, the time range is in naive UTC like the XML file names
+current_date = datetime.now(timezone.utc).replace(tzinfo=None)
+if args.hours is not None:
+    args.start = current_date - timedelta(hours=args.hours)
 
 # Check if the required user configuration is set
 pskr.check_user_config()
@@ -26,60 +54,44 @@ pskr.check_user_config()
 # You can set the map projection to something else if you prefer, e.g., PlateCarree(), Mercator(), etc. See Cartopy documentation for more options.
 projection = pskr.set_map_projection()
 
+# Get the reception reports in the requested range
+records, index = pskr.query_reports(args.start, args.end, args.band, args.min_snr, args.callsign, useStore=args.store)
 
-# Initialize the plot
-ax = pskr.setup_plot()
+if not index['captures']:
+    if args.store:
+        print("No captures found in the report store for this time range. Run pskr-plot-ingest.py first to fill it from the XML files.")
+    else:
+        print("No XML files found in the './pskr-xmldata/' directory for this time range. Please ensure the directory exists and contains XML files.")
+    exit(1)
+print(f"Found {len(records)} matching reports in {len(index['captures'])} captures.")
 
-# Get signal reports from PSK Reporter
-#reports = pskr.getSignalReports()
-#print(ET.tostring(reports, encoding='unicode')) # For debugging
+# Use the last capture's datetime for the nightshade and the plot name
+xml_datetime = pskr.seconds_to_datetime(max(capture['time'] for capture in index['captures']))
 
-# Get XML file names
-xmlFiles = pskr.get_xml_files()
+# One plot per station when several stations are configured, the rows are split by receiver in one pass
+for station, stationRecords in pskr.split_records_by_station(records, index):
+    # Initialize the plot, the figure and basemap are reused for every station
+    ax = pskr.setup_plot(reuseFigure=True)
 
-# Get the last XML file's datetime
-xml_datetime = pskr.get_time_from_xml(xmlFiles[-1])
+    if args.heatmap:
+        # One layer for all the reports, the drawing time does not grow with the number of reports
+        pskr.plot_report_heatmap(ax, stationRecords, args.heatmap)
+    else:
+        # Plot all the signal paths and the QTH locator on the map
+        pskr.plot_report_records(ax, stationRecords, index)
 
-if not xmlFiles:
-    print("No XML files found in the './pskr-xmldata/' directory. Please ensure the directory exists and contains XML files.")
-    exit(1)
-else:
-    reports = pskr.parse_xml_files(xmlFiles)
-
-receptionReports = reports.findall('.//receptionReport')
-#print(receptionReports)
-for report in receptionReports:
-    
-    callsign, frequency, senderLocator, receiverLocator, signal_strength = pskr.get_report_attributes(report)
-    
-    if not (callsign and frequency and senderLocator and receiverLocator and signal_strength):
-        print("!", end='') # Print an exclamation mark if any of the attributes are missing
-        continue # If any atributes are missing, skip plotting this report
-    else: 
-        # Convert Maidenhead locator to longitude and latitude (This order is important for plotting)
-        coords = pskr.get_lat_lon_from_locator(senderLocator)
-        QTHcoords = pskr.get_lat_lon_from_locator(receiverLocator)
-
-        print(".", end='') # Prints a dot for each valid report processed
-
-        # More verbose status output
-        #print(f"Callsign: {callsign}, Locator: {senderLocator}, Coordinates: {coords}, SNR: {signal_strength}")
-        #print("Adding to map...")
-
-    
-        # Plot the signal path and QTH locator on the map making sure that the attributes are not None
-        pskr.plot_signal_path(ax, coords, QTHcoords, frequency, signal_strength)
-        pskr.plot_qth_locator(ax, QTHcoords)
-
-print('\n')
-
-nightshade = pskr.setup_nightshade(xml_datetime)
-ax.add_feature(nightshade)
-
-# Add title and text to the plot
-# TODO: Add the last XML file date and time to the text box instead of the current date.
-pskr.add_title_and_text(plt, ax, xml_datetime)
-
-plt.savefig(f"./plots/psk_reporter_signal_reports.{pskr.format_datetime(xml_datetime, 'file')}.png", bbox_inches='tight', dpi=300)
-print(f"Plot saved as psk_reporter_signal_reports.{pskr.format_datetime(xml_datetime, 'file')}.png")
+    pskr.add_nightshade(ax, xml_datetime)
+
+    # Add title and text to the plot
+    pskr.add_title_and_text(plt, ax, xml_datetime, station)
+
+    outputFile = pskr.get_plot_filename(xml_datetime, station)
+    with pskr.stage_timer('savefig'):
+        plt.savefig(outputFile, **pskr.get_savefig_kwargs(ax.figure))
+    print(f"Plot saved as {outputFile}")
+
+# Keep the projected signal paths and nightshade for the next run
+pskr.save_render_caches()
+pskr.write_run_stats('pskr-plot-xmldata-all.py', **pskr.stop_profiling(), captures=len(index['captures']), reports=len(records),
+                     heatmap=args.heatmap, store=args.store)
 #plt.show()
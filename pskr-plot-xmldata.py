@@ -3,85 +3,198 @@
 # PSK Reporter Signal Reports Plotter
 # This script fetches signal reports from PSK Reporter and plots them on a world map using Cartopy and Matplotlib.
 # It visualizes the signal paths and reception reports based on frequency bands.
-# Requires the 'requests', 'maidenhead', 'matplotlib', and 'cartopy' libraries.
+# Requires the 'requests', 'numpy', 'matplotlib', and 'cartopy' libraries.
 
 # This 'batch' version that handles several XML files at once, it saves one plot per XML file.
 # Using the animation helper script, you can convert the individual plots into an animated GIF/video.
 
 # The script requires the directory './plots/' to be created in the same directory as this script to save the output plot.
 
-from matplotlib import pyplot as plt
+# Usage: python pskr-plot-xmldata.py [--workers N]
+# --workers N renders N plots at a time in separate processes, use 0 to use every CPU core.
+# --incremental only plots XML files that are new or changed since the last run, or when the map settings have changed.
+# --video FILE renders every XML file straight into one animation (e.g. ./plots/PSKR-animation.mp4 or .gif) instead of PNG files,
+#   --width and --fps set the frame width in pixels and the frame rate. Needs ffmpeg, except for GIF files.
+#   With several stations in myStations one video is written per station, with the callsign added to the file name.
+# --render-profile preview|standard|archival, --size WxH (e.g. 1920x1080) and --format png|webp|jpg set the resolution,
+# coastlines and image format of the plots, preview renders in a fraction of the time. The profiles are set in pskrfunctions.py.
+# --cprofile FILE and --tracemalloc profile the run (only the main process when plotting with several workers), the time
+#   spent in each stage is always added to the run statistics file set in pskrfunctions.py.
+
+import argparse
+import os
+from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import pskrfunctions as pskr
 
 # Get current date and time in UTC
 # current_date = datetime.now(timezone.utc) #Not used in this script, the date is derived from the XML file name.
 
-# Check if the required user configuration is set
-pskr.check_user_config()
-
-# Cartopy Map Options
-projection = pskr.set_map_projection() # You can set the map projection to something else if you prefer in pskrfunctions.py
-
-
-# Initialize the plot
-ax = pskr.setup_plot()
-
-xmlFiles = pskr.get_xml_files()
-
-# For each XML file found, parse it and extract the reception reports and plot them
-if not xmlFiles:
-    print("No XML files found in the './pskr-xmldata/' directory. Please ensure the directory exists and contains XML files.")
-    exit(1)
-else:
-    for xml_file in xmlFiles:
-        xml_datetime = pskr.get_time_from_xml(xml_file)
-
-        print("XML Datetime: " + pskr.format_datetime(xml_datetime, 'console'))
-        file_datetime = pskr.format_datetime(xml_datetime, 'file')
-        label_datetime = pskr.format_datetime(xml_datetime, 'label')
-
-        # Set the day/night shading based on the XML file's datetime
-        nightshade = pskr.setup_nightshade(xml_datetime)
-        ax.add_feature(nightshade)
-        print(f"Parsing XML file: {xml_file}")
-        reports = pskr.parse_xml_file(xml_file)
-        receptionReport = reports.findall('.//receptionReport')
-
-        #print(receptionReports)
-        for report in receptionReport:
-            # Get the attributes from the a single reception report
-            callsign, frequency, senderLocator, receiverLocator, signal_strength = pskr.get_report_attributes(report)
-            
-            if not (callsign and frequency and senderLocator and receiverLocator and signal_strength):
-                print("Skipping incomplete report.") # Print an exclamation mark if any of the attributes are missing
-                continue # If any atributes are missing, skip plotting this report
-            else: 
-                # Convert Maidenhead locator to longitude and latitude (This order is important for plotting)
-                coords = pskr.get_lat_lon_from_locator(senderLocator)
-                QTHcoords = pskr.get_lat_lon_from_locator(receiverLocator)
-
-                # Convert Maidenhead locator to longitude and latitude (This order is imprortant for plotting)
-                coords = pskr.get_lat_lon_from_locator(senderLocator)
-                # Convert configured QTH locator to latitude and longitude
-                QTHcoords = pskr.get_lat_lon_from_locator(receiverLocator)
-
-                print(f"Callsign: {callsign}, Locator: {senderLocator}, Coordinates: {coords}, SNR: {signal_strength}")
-                print("Adding to map...")
-
-                # Plot the signal path and QTH locator on the map
-                pskr.plot_signal_path(ax, coords, QTHcoords, frequency, signal_strength)
-                pskr.plot_qth_locator(ax, QTHcoords)
-
-        # Add title and text to the plot
-        pskr.add_title_and_text(plt, ax, xml_datetime)
-        
-        # Save the plot to the './plots/' directory with a timestamp
-        plt.savefig(f"./plots/psk_reporter_signal_reports.{file_datetime}.png", bbox_inches='tight', dpi=300)
-        print(f"Plot saved as psk_reporter_signal_reports.{file_datetime}.png")
-
-        # Close and restart plot or the plots start accumulating picture by picture
-        plt.close()
-        ax = pskr.setup_plot()
-        #plt.show()
-
-print("All XML files processed and plots generated.")
\ No newline at end of file
+# Video file name of a station, the callsign is added before the extension when several stations are plotted
+def get_station_video_file(outputFile, station):
+    outputFile = Path(outputFile)
+    if station is None:
+        return outputFile
+    return outputFile.with_name(f"{outputFile.stem}.{pskr.get_station_file_tag(station)}{outputFile.suffix}")
+
+# Renders the XML files in capture time order straight into a video file per station.
+# Returns the list of XML files that failed and the list of video files written.
+def write_video(xmlFiles, outputFile, width, fps, workers):
+    xmlFiles = [xml_file for _, xml_file in pskr.build_capture_index(xmlFiles)]
+    dpi, bbox = pskr.get_video_layout(width)
+    writers = {}
+    failed = []
+
+    def add_frame(result):
+        xml_file, frames, error, stats, cacheEntries = result
+        pskr.merge_run_stats(stats)
+        pskr.merge_new_cache_entries(cacheEntries)
+        if error:
+            failed.append(xml_file)
+            print(f"Failed to plot {xml_file}: {error}")
+            return
+        for station, rgba in frames:
+            # The frame size is only known exactly once the first frame is drawn
+            if station not in writers:
+                writers[station] = pskr.open_video_writer(get_station_video_file(outputFile, station), rgba.shape[1], rgba.shape[0], fps)
+            pskr.write_video_frame(writers[station], rgba)
+        print(f"Added frame {xml_file}")
+
+    print(f"Rendering {len(xmlFiles)} frames to {outputFile}...")
+    try:
+        if workers == 1:
+            pskr.warm_render_caches(dpi)
+            for xml_file in xmlFiles:
+                add_frame(pskr.render_xml_file_frame(xml_file, dpi, bbox))
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=pskr.init_render_worker, initargs=(dpi, pskr.activeRenderProfile))
+            try:
+                # map() returns the frames in capture order even though they are rendered in parallel
+                for result in pool.map(pskr.render_xml_file_frame, xmlFiles, repeat(dpi), repeat(bbox)):
+                    add_frame(result)
+            finally:
+                # On Ctrl+C (the workers ignore it) the frames that have not started are dropped instead of rendered
+                pool.shutdown(cancel_futures=True)
+    finally:
+        for writer in writers.values():
+            pskr.close_video_writer(writer)
+    return failed, [writer['outputFile'] for writer in writers.values()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Plot one PNG file for each XML file in the ./pskr-xmldata/ directory, one per station when several are configured.')
+    parser.add_argument('--workers', type=int, default=1, help='number of plots to render in parallel, 0 uses every CPU core (default: 1)')
+    parser.add_argument('--incremental', action='store_true', help='only plot XML files that are new or changed since the last run')
+    parser.add_argument('--video', help='render all XML files into this video or GIF file instead of one PNG file each')
+    parser.add_argument('--width', type=int, default=pskr.videoWidth, help=f'video frame width in pixels (default: {pskr.videoWidth})')
+    parser.add_argument('--fps', type=float, default=pskr.videoFps, help=f'video frames per second (default: {pskr.videoFps})')
+    pskr.add_render_arguments(parser)
+    pskr.add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+    pskr.apply_render_arguments(args)
+    pskr.start_profiling(args.cprofile, args.tracemalloc)
+
+    # Check if the required user configuration is set
+    pskr.check_user_config()
+
+    xmlFiles = pskr.get_xml_files()
+
+    # For each XML file found, parse it and extract the reception reports and plot them
+    if not xmlFiles:
+        print("No XML files found in the './pskr-xmldata/' directory. Please ensure the directory exists and contains XML files.")
+        exit(1)
+
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+
+    if args.video:
+        try:
+            failed, videoFiles = write_video(xmlFiles, args.video, args.width, args.fps, workers)
+        except (RuntimeError, OSError, BrokenProcessPool) as e:
+            print(f"Could not write {args.video}: {e}")
+            exit(1)
+        except KeyboardInterrupt:
+            print("Interrupted, the video holds the frames rendered so far.")
+            pskr.save_render_caches()
+            exit(130)
+        pskr.save_render_caches()
+        if failed:
+            print(f"{len(failed)} of {len(xmlFiles)} XML files could not be plotted.")
+        for videoFile in videoFiles:
+            print(f"Video saved as {videoFile}")
+        pskr.write_run_stats('pskr-plot-xmldata.py', **pskr.stop_profiling(), mode='video', files=len(xmlFiles), failed=len(failed), workers=workers)
+        return
+
+    # The manifest records every plot so later incremental runs know what is already up to date
+    configHash = pskr.get_render_config_hash()
+    frames = pskr.load_render_manifest(configHash)
+    if args.incremental:
+        totalFiles = len(xmlFiles)
+        xmlFiles = [xml_file for xml_file in xmlFiles if not pskr.is_plot_up_to_date(frames, xml_file, configHash)]
+        print(f"{totalFiles - len(xmlFiles)} of {totalFiles} plots are up to date.")
+        if not xmlFiles:
+            print("Nothing to plot.")
+            return
+
+    failed = []
+
+    # Records the result of render_xml_file() in the manifest
+    def add_result(result):
+        xml_file, outputFiles, error, stats, cacheEntries = result
+        pskr.merge_run_stats(stats)
+        # Keep what a worker projected, the workers do not save the caches
+        pskr.merge_new_cache_entries(cacheEntries)
+        if error:
+            failed.append(xml_file)
+            print(f"Failed to plot {xml_file}: {error}")
+        else:
+            for outputFile in outputFiles:
+                print(f"Plot saved as {outputFile}")
+            pskr.record_plot(frames, xml_file, outputFiles, configHash)
+
+    try:
+        if workers == 1:
+            for xml_file in xmlFiles:
+                add_result(pskr.render_xml_file(xml_file, verbose=True))
+        else:
+            print(f"Plotting {len(xmlFiles)} XML files with {workers} worker processes...")
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=pskr.init_render_worker, initargs=(None, pskr.activeRenderProfile))
+            futures = [pool.submit(pskr.render_xml_file, xml_file) for xml_file in xmlFiles]
+            recorded = set()
+            try:
+                for future in as_completed(futures):
+                    recorded.add(future)
+                    add_result(future.result())
+            except KeyboardInterrupt:
+                # The workers ignore Ctrl+C. Drop the files that have not started, wait for the plots in progress and
+                # record them as well.
+                pool.shutdown(cancel_futures=True)
+                for future in futures:
+                    if future not in recorded and not future.cancelled() and future.exception() is None:
+                        add_result(future.result())
+                raise
+            finally:
+                pool.shutdown(cancel_futures=True)
+    except KeyboardInterrupt:
+        print("Interrupted, the plots made so far are kept for the next --incremental run.")
+        pskr.save_render_manifest(frames)
+        pskr.save_render_caches()
+        exit(130)
+    except BrokenProcessPool as e:
+        # A worker process died (out of memory for example), the remaining plots were not rendered
+        print(f"A worker process stopped unexpectedly: {e}")
+        pskr.save_render_manifest(frames)
+        pskr.save_render_caches()
+        exit(1)
+
+    # Keep the manifest, the projected signal paths and nightshade for the next run
+    pskr.save_render_manifest(frames)
+    pskr.save_render_caches()
+
+    if failed:
+        print(f"{len(failed)} of {len(xmlFiles)} XML files could not be plotted.")
+    print("All XML files processed and plots generated.")
+    pskr.write_run_stats('pskr-plot-xmldata.py', **pskr.stop_profiling(), mode='png', files=len(xmlFiles), failed=len(failed), workers=workers)
+
+if __name__ == '__main__':
+    main()
@@ -5,13 +5,40 @@ from cartopy import feature as cfeature
 from cartopy.feature.nightshade import Nightshade as cnightshade
 from matplotlib import pyplot as plt
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 import xml.etree.ElementTree as ET
-from datetime import datetime, timezone
+from collections import OrderedDict, namedtuple
+import os
+import pickle
+import hashlib
+import signal
+import shutil
+import subprocess
+import json
+from bisect import bisect_left, bisect_right
+from PIL import Image
+import argparse
+import matplotlib as mpl
+from datetime import datetime, timedelta, timezone
 from numpy import interp
-import maidenhead as mh
+import numpy as np
 from matplotlib.offsetbox import AnchoredText
-import re
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba, LogNorm
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path as Path2D
+from matplotlib.transforms import Bbox
+from cartopy.mpl.path import shapely_to_path
+import time
+import cProfile
+import pstats
+import tracemalloc
+import gzip
+import zlib
+import io
+from contextlib import contextmanager
+from functools import wraps
 
 
 ### USER CONFIGURATION, THIS IS REQUIRED ###
@@ -22,14 +49,233 @@ myCallsign = 'KE7BUA'
 # Set your locator here (optional, can be derived from callsign) Note: Not currently used in this script
 myLocator = 'DM26ic' # Supports 6 character Maidenhead locator, possibly up to 8
 
+# To plot several stations, list each one as a (callsign, locator) pair. Every fetch gets the reports of all of them and
+# one plot is saved per station, with the callsign in the file name. For example:
+# myStations = [(myCallsign, myLocator), ('N0CALL', 'EM10ab')]
+myStations = [(myCallsign, myLocator)]
+
 # Set the time resolution here (in NEGATIVE seconds) for the PSK Reporter query, default is -300 seconds (5 minutes)
 requestTime = -300
 
+# Seconds between API requests in pskr-plot-continuous.py, PSK Reporter asks for no more than one request every 5 minutes
+pollInterval = 300
+# Seconds to wait for the PSK Reporter API to answer before giving up on a request
+requestTimeout = 60
+
 # User defined map options
 # You do not need to change these unless you want to customize the map appearance.
 coastlineBorderResolution = '10m'  # Options: '10m', '50m', '110m'
 coastlineBorderWidth = 0.5
 countrylineBorderWidth = 0.5
+figureSize = (12, 8) # Figure size in inches
+outputDpi = 300 # Resolution of the saved PNG files
+
+# Render profiles, choose one with the --render-profile option of the plot scripts. A profile sets the resolution, the
+# coastline and border resolution, antialiasing and the image format of the saved plots:
+#   preview  - small plots that render in a fraction of the time, for a quick look or a dashboard thumbnail
+#   standard - the settings above
+#   archival - twice the resolution and the smallest lossless PNG files, slow
+# format is 'png', 'webp' or 'jpg'. pngCompressLevel goes from 0 (fastest, largest files) to 9 (slowest, smallest files),
+# quality is used for WebP and JPEG files.
+renderProfiles = {
+    'preview': {'dpi': 80, 'coastlines': '110m', 'antialiased': False, 'format': 'png', 'pngCompressLevel': 1, 'quality': 80},
+    'standard': {'dpi': outputDpi, 'coastlines': coastlineBorderResolution, 'antialiased': True, 'format': 'png', 'pngCompressLevel': 6, 'quality': 90},
+    'archival': {'dpi': 600, 'coastlines': '10m', 'antialiased': True, 'format': 'png', 'pngCompressLevel': 9, 'quality': 95},
+}
+renderProfile = 'standard' # Profile used when --render-profile is not given
+outputSize = None # Exact (width, height) of the saved plots in pixels, e.g. (1920, 1080), instead of the dpi of the profile. Same as --size 1920x1080
+
+# Static basemap, the projection, coastlines and borders are drawn once to an image and reused for every plot
+useBasemapCache = True # Set to False to draw the coastlines and borders again for every plot
+basemapCacheDir = './pskr-cache/' # Rendered basemaps are saved here so later runs start warm, set to None to keep them in memory only
+
+# Heatmap mode of pskr-plot-xmldata-all.py --heatmap, reports are binned into grid cells of this size in degrees
+heatmapCellLon = 2 # The default 2 x 1 degree cells are the 4 character Maidenhead grid squares
+heatmapCellLat = 1
+
+# Video output of pskr-plot-xmldata.py --video, frames are piped straight into ffmpeg without saving PNG files
+videoWidth = 1920 # Frame width in pixels, the height follows from the map projection
+videoFps = 12
+
+# Records which XML files have already been plotted, used by the --incremental option of pskr-plot-xmldata.py
+renderManifestFile = './pskr-cache/render-manifest.json'
+
+# Columnar report store, filled by pskr-plot-ingest.py so the plot scripts can skip parsing XML (see --store)
+reportStoreDir = './pskr-store/'
+
+# Capture archive, pskr-plot-archive.py packs the XML files in './pskr-xmldata/' into one compressed bundle per day (or hour).
+# The plot scripts read the bundles the same way as the XML files, see get_xml_files().
+archivePeriod = 'day' # 'day' or 'hour'
+archiveCompressLevel = 6 # gzip level, 1 is fastest and 9 is smallest
+archiveMinAgeMinutes = 10 # XML files younger than this are left alone, the capture may still be being written
+
+# Number of points each signal path is interpolated to along the great circle before it is projected onto the map
+greatCirclePoints = 32
+
+# Projected signal paths are cached by sender and receiver locator so repeated grid squares are only projected once
+greatCircleCacheSize = 50000 # Maximum number of locator pairs kept in memory, the least recently used pairs are dropped first
+greatCircleCacheFile = './pskr-cache/greatcircle-cache.pkl' # Saved between runs so later runs start warm, set to None to keep the cache in memory only
+
+# Maximum number of decoded Maidenhead locators remembered between calls, the least recently used locators are dropped first
+locatorCacheSize = 20000
+
+# The projected day/night shading is cached by projection, day of the year and time of day rounded to this many minutes.
+# The terminator moves 1/4 degree per minute, so the default shades at most 1.25 degrees off while frames 5 minutes apart share one outline.
+nightshadeQuantizeMinutes = 10
+nightshadeCacheSize = 300 # Maximum number of outlines kept (300 is two days of 10 minute steps, about 1 MB), the least recently used are dropped first
+nightshadeCacheFile = './pskr-cache/nightshade-cache.pkl' # Saved between runs, set to None to keep the cache in memory only
+
+# Every run appends one JSON line to this file with the wall and CPU time spent in each stage (parsing, locators,
+# projecting the paths, nightshade, saving the PNG, ...) and the number of reports parsed, skipped and plotted.
+runStatsFile = './pskr-cache/run-stats.jsonl' # Set to None to turn the run statistics off
+# Reports are counted instead of printed one by one, a progress line is printed at most this often in seconds
+progressInterval = 2
+printEachReport = False # Set to True to print every report again (slow with thousands of reports)
+
+# Time and counts of the current run, see stage_timer() and count_stat()
+runStats = {'wallStart': time.perf_counter(), 'cpuStart': time.process_time(), 'stages': {}, 'counters': {}, 'stack': []}
+profiler = None
+profileFile = None
+progressState = {'label': None, 'last': 0.0}
+
+# Starts a new set of run statistics, pskr-plot-continuous.py calls this for every fetch
+def reset_run_stats():
+    runStats.update(wallStart=time.perf_counter(), cpuStart=time.process_time(), stages={}, counters={}, stack=[])
+
+# Adds the wall and CPU time spent inside the with block to a stage of the run statistics.
+# Stages can be nested, the time of an inner stage is only counted for the inner stage so the stages add up to the run time.
+@contextmanager
+def stage_timer(name):
+    wallStart, cpuStart = time.perf_counter(), time.process_time()
+    frame = [0.0, 0.0] # Time spent in inner stages
+    runStats['stack'].append(frame)
+    try:
+        yield
+    finally:
+        runStats['stack'].pop()
+        wall, cpu = time.perf_counter() - wallStart, time.process_time() - cpuStart
+        stage = runStats['stages'].setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+        stage['calls'] += 1
+        stage['wall_s'] += wall - frame[0]
+        stage['cpu_s'] += cpu - frame[1]
+        if runStats['stack']:
+            runStats['stack'][-1][0] += wall
+            runStats['stack'][-1][1] += cpu
+
+# Decorator version of stage_timer(), times every call of the function
+def timed_stage(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage_timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Adds to a counter of the run statistics, e.g. the number of reports plotted
+def count_stat(name, amount=1):
+    runStats['counters'][name] = runStats['counters'].get(name, 0) + int(amount)
+
+# Returns the stage times and counters collected so far and clears them. Worker processes send these back to the
+# main process, which adds them to its own with merge_run_stats().
+def take_run_stats():
+    stats = {'stages': runStats['stages'], 'counters': runStats['counters']}
+    runStats['stages'], runStats['counters'] = {}, {}
+    return stats
+
+def merge_run_stats(stats):
+    for name, stage in stats['stages'].items():
+        total = runStats['stages'].setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+        for field in total:
+            total[field] += stage[field]
+    for name, amount in stats['counters'].items():
+        count_stat(name, amount)
+
+# Prints a progress line for a long loop, at most once every progressInterval seconds
+def report_progress(label, done, total=None):
+    now = time.monotonic()
+    if progressState['label'] != label:
+        progressState['label'], progressState['last'] = label, now
+        return
+    if now - progressState['last'] < progressInterval:
+        return
+    progressState['last'] = now
+    print(f"{label}: {done}" + (f"/{total}" if total else ""))
+
+# Adds the --cprofile and --tracemalloc options to a script's argument parser
+def add_instrumentation_arguments(parser):
+    parser.add_argument('--cprofile', metavar='FILE', help='profile the run with cProfile and save the statistics to FILE (for pstats or snakeviz)')
+    parser.add_argument('--tracemalloc', action='store_true', help='trace memory allocations, shows the peak and the largest allocations at the end')
+
+# Starts cProfile (saved to cprofileFile) and/or tracemalloc for the rest of the run.
+# cProfile only sees the thread it is enabled in. Scripts that do their work in other threads pass enable=False and
+# wrap that work in profiled() instead.
+def start_profiling(cprofileFile=None, traceMemory=False, enable=True):
+    global profiler, profileFile
+    if traceMemory:
+        tracemalloc.start()
+    if cprofileFile:
+        profileFile = cprofileFile
+        profiler = cProfile.Profile()
+        if enable:
+            profiler.enable()
+
+# Profiles the code in the with block in the thread it runs in, with the profiler of start_profiling(enable=False).
+# The statistics add up over every block until stop_profiling().
+@contextmanager
+def profiled():
+    if profiler is None:
+        yield
+        return
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+# Stops the profiling started by start_profiling(), prints what it found and returns it for the run statistics
+def stop_profiling():
+    global profiler
+    details = {}
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profileFile)
+        print(f"cProfile statistics saved as {profileFile}, the slowest functions:")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        details['cprofile'] = str(profileFile)
+        profiler = None
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"Peak traced memory: {peak / 2**20:.1f} MB, largest allocations still held:")
+        for statistic in snapshot.statistics('lineno')[:10]:
+            print(f"  {statistic}")
+        details['peak_traced_mb'] = round(peak / 2**20, 1)
+    return details
+
+# Prints a one line summary of the run statistics and appends them as a JSON line to runStatsFile.
+# Extra keyword arguments (the number of files, workers, ...) are added to the JSON line.
+def write_run_stats(script, **details):
+    wall, cpu = time.perf_counter() - runStats['wallStart'], time.process_time() - runStats['cpuStart']
+    stages = {name: {'calls': stage['calls'], 'wall_s': round(stage['wall_s'], 4), 'cpu_s': round(stage['cpu_s'], 4)}
+              for name, stage in sorted(runStats['stages'].items(), key=lambda item: -item[1]['wall_s'])}
+    summary = {'time': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'script': script, 'pid': os.getpid(),
+               'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4), 'stages': stages, 'counters': dict(runStats['counters'])}
+    summary.update(details)
+
+    stageText = ', '.join(f"{name} {stage['wall_s']:.2f}s" for name, stage in list(stages.items())[:6])
+    if details.get('workers', 1) > 1:
+        stageText += f", summed over {details['workers']} worker processes"
+    print(f"Run took {wall:.2f}s ({stageText})")
+    if runStatsFile is not None:
+        try:
+            Path(runStatsFile).parent.mkdir(parents=True, exist_ok=True)
+            with open(runStatsFile, 'a') as file:
+                file.write(json.dumps(summary) + '\n')
+        except OSError as e:
+            print(f"Could not save run statistics to {runStatsFile}: {e}")
+    return summary
 
 # Cartopy Map Projection
 # You can set the map projection to something else if you prefer, e.g., PlateCarree(), Mercator(), etc. See Cartopy documentation for more options.
@@ -45,69 +291,561 @@ def set_map_projection():
 # Check if the above user configuration is set
 
 def check_user_config():
-    if myCallsign == 'YOUR_CALLSIGN' or myLocator == 'YOUR_GRIDSQUARE_LOCATOR':
-        print("Please set your callsign in pskrfunctions.py before running this script.")
+    if not myStations:
+        print("Please add at least one station to myStations in pskrfunctions.py before running this script.")
         exit(1)
+    for callsign, locator in myStations:
+        if callsign == 'YOUR_CALLSIGN' or locator == 'YOUR_GRIDSQUARE_LOCATOR':
+            print("Please set your callsign in pskrfunctions.py before running this script.")
+            exit(1)
+    callsigns = [callsign for callsign, _ in get_stations()]
+    if len(set(callsigns)) != len(callsigns):
+        print("Every station in myStations must have a different callsign.")
+        exit(1)
+
+# Returns the configured stations as a list of (callsign, locator) with the callsigns in upper case
+def get_stations():
+    return [(callsign.strip().upper(), locator.strip()) for callsign, locator in myStations]
+
+# Returns the station callsigns to save separate plots for, [None] when only one station is configured so the plot
+# names and titles stay the same as before
+def get_frame_stations():
+    stations = get_stations()
+    return [callsign for callsign, _ in stations] if len(stations) > 1 else [None]
+
+# Output settings of the render profile in use, set by apply_render_profile(). outputDpi and coastlineBorderResolution
+# above are set by the profile as well.
+outputAntialiased = True
+outputFormat = 'png'
+pngCompressLevel = 6
+outputQuality = 90
+activeRenderProfile = (renderProfile, None, None) # Arguments of the last apply_render_profile() call, passed on to worker processes
+
+# Switches to a render profile from renderProfiles. size is an exact (width, height) in pixels and imageFormat overrides the
+# format of the profile. Antialiasing is set through the matplotlib defaults, so it also applies to the basemap. It is only
+# turned off for lines and patches, text without it loses thin strokes like the colons of the date at low resolutions.
+def apply_render_profile(name, size=None, imageFormat=None):
+    global outputDpi, coastlineBorderResolution, outputAntialiased, outputFormat, pngCompressLevel, outputQuality, outputSize, activeRenderProfile
+    profile = renderProfiles[name]
+    outputDpi = profile['dpi']
+    coastlineBorderResolution = profile['coastlines']
+    outputAntialiased = profile['antialiased']
+    outputFormat = profile['format'] if imageFormat is None else imageFormat
+    pngCompressLevel = profile['pngCompressLevel']
+    outputQuality = profile['quality']
+    if size is not None:
+        outputSize = size
+    activeRenderProfile = (name, size, imageFormat)
+    for setting in ('lines.antialiased', 'patch.antialiased'):
+        mpl.rcParams[setting] = outputAntialiased
+
+# Adds the --render-profile, --size and --format options shared by the plot scripts, see apply_render_arguments()
+def add_render_arguments(parser):
+    parser.add_argument('--render-profile', choices=list(renderProfiles), default=renderProfile,
+                        help=f'resolution, coastlines, antialiasing and image format of the plots, preview is the fastest (default: {renderProfile})')
+    parser.add_argument('--size', type=parse_size, metavar='WxH', help='save the plots at exactly this size in pixels, e.g. 1920x1080, instead of the dpi of the profile')
+    parser.add_argument('--format', choices=['png', 'webp', 'jpg'], help='image format of the saved plots (default: that of the profile)')
+
+# Applies the options added by add_render_arguments()
+def apply_render_arguments(args):
+    apply_render_profile(args.render_profile, args.size, args.format)
+
+# Parses a WxH size option like 1920x1080 into a (width, height) tuple
+def parse_size(size):
+    try:
+        width, height = (int(value) for value in size.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{size}', use WIDTHxHEIGHT in pixels, e.g. 1920x1080")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"invalid size '{size}', the width and height must be positive")
+    return width, height
+
+# Layout of the plots saved at an exact size, keyed by projection, figure size and pixel size
+sizeLayoutCache = {}
+
+# Returns the dpi and the bounding box (in inches) that save a figure at exactly width x height pixels. The tight bounding
+# box around the map, title, text box and colorbar is widened or heightened to the requested aspect ratio and the dpi
+# is chosen to fill it. Without a height it follows from the aspect ratio of the tight bounding box.
+def fit_figure_to_size(fig, width, height=None):
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(0.1)
+    if height is None:
+        height = round(width * bbox.height / bbox.width)
+    dpi = min(width / bbox.width, height / bbox.height)
+    boxWidth, boxHeight = width / dpi, height / dpi
+    return dpi, Bbox.from_bounds(bbox.x0 - (boxWidth - bbox.width) / 2, bbox.y0 - (boxHeight - bbox.height) / 2, boxWidth, boxHeight)
+
+# Returns the dpi and bounding box of fit_figure_to_size() for a plot of an empty map with a title and text box.
+# It is measured once and gives the dpi the basemap is drawn at before the real plot exists.
+def get_size_layout(width, height):
+    projection = set_map_projection()
+    key = (projection.proj4_init, tuple(figureSize), width, height)
+    if key not in sizeLayoutCache:
+        layoutFig = plt.figure(figsize=figureSize, dpi=100)
+        layoutAx = layoutFig.add_subplot(1, 1, 1, projection=projection)
+        layoutAx.set_global()
+        add_title_and_text(plt, layoutAx, datetime.now(timezone.utc))
+        sizeLayoutCache[key] = fit_figure_to_size(layoutFig, width, height)
+        plt.close(layoutFig)
+    return sizeLayoutCache[key]
+
+# Returns the dpi the plots are drawn at, that of the render profile or the one that gives outputSize
+def get_output_dpi():
+    return get_size_layout(*outputSize)[0] if outputSize is not None else outputDpi
 
-def setup_plot(coastlinesResolution=coastlineBorderResolution, coastlinesLineWidth=coastlineBorderWidth, bordersLineWidth=countrylineBorderWidth):
+# Returns the savefig() arguments of the render profile for fig: the dpi and bounding box, and the PNG compression level
+# or the WebP/JPEG quality, which are handed to Pillow. With outputSize the figure itself is measured, so anything
+# added around the map, like the heatmap colorbar, fits in the requested size as well.
+def get_savefig_kwargs(fig):
+    if outputSize is not None:
+        dpi, bbox = fit_figure_to_size(fig, *outputSize)
+    else:
+        dpi, bbox = outputDpi, 'tight'
+    pilKwargs = {'compress_level': pngCompressLevel} if outputFormat == 'png' else {'quality': outputQuality}
+    return {'bbox_inches': bbox, 'dpi': dpi, 'pil_kwargs': pilKwargs}
+
+# Set reuseFigure to clear and reuse the figure from the previous call instead of creating a new one.
+@timed_stage('setup_plot')
+def setup_plot(coastlinesResolution=None, coastlinesLineWidth=coastlineBorderWidth, bordersLineWidth=countrylineBorderWidth, useBasemap=None, dpi=None, reuseFigure=False):
     global ax, fig
-    fig = plt.figure(figsize=(12, 8), dpi=100)
+    useBasemap = useBasemapCache if useBasemap is None else useBasemap
+    # The render profile can change the coastline resolution and dpi after this module is loaded
+    coastlinesResolution = coastlineBorderResolution if coastlinesResolution is None else coastlinesResolution
+    dpi = get_output_dpi() if dpi is None else dpi
+
+    if reuseFigure and 'fig' in globals() and plt.fignum_exists(fig.number):
+        fig.clf()
+    else:
+        fig = plt.figure(figsize=figureSize, dpi=100)
     ax = fig.add_subplot(1, 1, 1, projection=set_map_projection())
     ax.set_global()
     #ax.stock_img()
-    ax.coastlines(resolution=coastlinesResolution, linewidth=coastlinesLineWidth)
-    ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', linewidth=bordersLineWidth)
+    if useBasemap:
+        # Composite the pre-rendered coastlines and borders instead of drawing them again
+        basemap = get_basemap(coastlinesResolution, coastlinesLineWidth, bordersLineWidth, dpi)
+        ax.imshow(basemap, origin='upper', extent=ax.get_xlim() + ax.get_ylim(), transform=ax.projection,
+                  interpolation='nearest', zorder=0)
+        ax.set_global()
+    else:
+        ax.coastlines(resolution=coastlinesResolution, linewidth=coastlinesLineWidth)
+        ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', linewidth=bordersLineWidth)
     return ax
 
+# Rendered basemap images, keyed by projection, coastline resolution, line widths, figure size, dpi and antialiasing
+basemapCache = {}
+
+# Returns the coastlines and borders as an RGBA image covering the map area of a plot saved at the given dpi.
+# The image is rendered once, then served from memory or from basemapCacheDir.
+@timed_stage('basemap')
+def get_basemap(coastlinesResolution, coastlinesLineWidth, bordersLineWidth, dpi):
+    projection = set_map_projection()
+    key = (projection.proj4_init, coastlinesResolution, coastlinesLineWidth, bordersLineWidth, tuple(figureSize), dpi, outputAntialiased)
+    if key in basemapCache:
+        return basemapCache[key]
+
+    cacheFile = None
+    if basemapCacheDir is not None:
+        keyHash = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        cacheFile = Path(basemapCacheDir) / f'basemap-{keyHash}.png'
+        if cacheFile.exists():
+            try:
+                basemapCache[key] = np.asarray(Image.open(cacheFile).convert('RGBA'))
+                return basemapCache[key]
+            except OSError as e:
+                print(f"Could not read basemap {cacheFile}: {e}, rendering it again.")
+
+    print("Rendering basemap...")
+    basemapFig = plt.figure(figsize=figureSize, dpi=dpi)
+    basemapAx = basemapFig.add_subplot(1, 1, 1, projection=projection)
+    basemapAx.set_global()
+    basemapAx.coastlines(resolution=coastlinesResolution, linewidth=coastlinesLineWidth)
+    basemapAx.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', linewidth=bordersLineWidth)
+    # Only keep the lines, the background and map outline are still drawn by each plot
+    basemapFig.patch.set_visible(False)
+    basemapAx.patch.set_visible(False)
+    basemapAx.spines['geo'].set_visible(False)
+    basemapFig.canvas.draw()
+
+    # Crop the rendered figure to the map area, the buffer rows start at the top of the figure
+    rgba = np.asarray(basemapFig.canvas.buffer_rgba())
+    bbox = basemapAx.get_window_extent()
+    top, bottom = int(round(rgba.shape[0] - bbox.y1)), int(round(rgba.shape[0] - bbox.y0))
+    left, right = int(round(bbox.x0)), int(round(bbox.x1))
+    basemap = rgba[top:bottom, left:right].copy()
+    plt.close(basemapFig)
+
+    basemapCache[key] = basemap
+    if cacheFile is not None:
+        # Parallel workers can render the same basemap at the same time, each writes its own temporary file
+        tempFile = cacheFile.with_name(f'{cacheFile.stem}.{os.getpid()}.tmp.png')
+        try:
+            cacheFile.parent.mkdir(parents=True, exist_ok=True)
+            Image.fromarray(basemap).save(tempFile)
+            os.replace(tempFile, cacheFile)
+        except OSError as e:
+            print(f"Could not save basemap {cacheFile}: {e}")
+    return basemap
+
 def setup_nightshade(date, alpha=0.2, facecolor='black'):
     return cnightshade(date=date, alpha=alpha, facecolor=facecolor)
 
+# Least recently used cache of projected day/night terminator outlines, see get_nightshade_path()
+nightshadeCache = OrderedDict()
+nightshadeCacheLoaded = False
+nightshadeCacheChanged = False
+
+# Loads the saved nightshade cache from nightshadeCacheFile, only reads the file once per run
+def load_nightshade_cache():
+    global nightshadeCacheLoaded
+    if nightshadeCacheLoaded:
+        return
+    nightshadeCacheLoaded = True
+    load_lru_cache(nightshadeCache, nightshadeCacheFile, nightshadeCacheSize, 'nightshade')
+
+# Saves the nightshade cache to nightshadeCacheFile if anything was added since it was loaded
+def save_nightshade_cache():
+    global nightshadeCacheChanged
+    if nightshadeCacheFile is None or not nightshadeCacheChanged:
+        return
+    save_lru_cache(nightshadeCache, nightshadeCacheFile)
+    nightshadeCacheChanged = False
+
+# Returns the night side of the map at the given UTC date as a matplotlib Path in the projection's coordinates.
+# The time of day is rounded to nightshadeQuantizeMinutes and the year is left out of the cache key: the terminator
+# only depends on the day of the year and the time of day (within a fraction of a degree), so frames close together
+# and the same time on later years reuse the outline that was already projected.
+def get_nightshade_path(projection, date):
+    global nightshadeCacheChanged
+    load_nightshade_cache()
+
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    quantum = max(1, int(nightshadeQuantizeMinutes))
+    minute = (date.hour * 60 + date.minute) // quantum * quantum
+    key = (projection.proj4_init, quantum, date.month, date.day, minute)
+
+    cached = nightshadeCache.get(key)
+    if cached is not None:
+        nightshadeCache.move_to_end(key)
+        count_stat('nightshade_cache_hits')
+        return Path2D(*cached)
+    count_stat('nightshade_cache_misses')
+
+    # Shade the middle of the time step so the outline is never more than half a step off
+    shadeDate = datetime(date.year, date.month, date.day) + timedelta(minutes=minute + quantum / 2)
+    nightshade = cnightshade(date=shadeDate)
+    # The projected outline has thousands of points along the map edge and the terminator. Simplifying it to 1/20000 of
+    # the map width, well under a pixel even at 600 dpi, keeps about one in ten and makes the cache that much smaller.
+    tolerance = (projection.x_limits[1] - projection.x_limits[0]) / 20000
+    paths = [shapely_to_path(projection.project_geometry(geometry, nightshade.crs).simplify(tolerance, preserve_topology=True))
+             for geometry in nightshade.geometries()]
+    path = Path2D.make_compound_path(*paths)
+
+    nightshadeCache[key] = (path.vertices.astype(np.float32), path.codes)
+    nightshadeCacheChanged = True
+    if newCacheKeys is not None:
+        newCacheKeys['nightshade'].add(key)
+    while len(nightshadeCache) > nightshadeCacheSize:
+        nightshadeCache.popitem(last=False)
+    return path
+
+# Adds the day/night shading for the given date to the map. Same result as ax.add_feature(setup_nightshade(date)),
+# but the projected terminator comes from the nightshade cache instead of being projected again for every plot.
+@timed_stage('nightshade')
+def add_nightshade(ax, date, alpha=0.2, facecolor='black'):
+    # zorder 1.5 is what cartopy uses for features: above the basemap, below the signal paths
+    patch = PathPatch(get_nightshade_path(ax.projection, date), facecolor=facecolor, edgecolor='none', alpha=alpha,
+                      transform=ax.transData, zorder=1.5)
+    # add_artist() rather than add_patch(), the map limits are already set and working out the data limits of the
+    # terminator outline would take longer than drawing it
+    ax.add_artist(patch)
+    return patch
+
+# Saves the caches that are worth keeping between runs: the projected signal paths and nightshade outlines
+def save_render_caches():
+    save_great_circle_cache()
+    save_nightshade_cache()
+
+# Keys of the great circle and nightshade entries a worker process added since take_new_cache_entries() was last called.
+# Only set in worker processes (see init_render_worker()), which send the new entries back for the main process to save.
+newCacheKeys = None
+
+# Returns the cache entries this worker process added since the last call, None outside a worker process
+def take_new_cache_entries():
+    if newCacheKeys is None:
+        return None
+    entries = {'greatCircle': {key: greatCircleCache[key] for key in newCacheKeys['greatCircle'] if key in greatCircleCache},
+               'nightshade': {key: nightshadeCache[key] for key in newCacheKeys['nightshade'] if key in nightshadeCache}}
+    for keys in newCacheKeys.values():
+        keys.clear()
+    return entries
+
+# Adds the cache entries sent back by a worker process to the caches of this process, so save_render_caches() keeps them
+def merge_new_cache_entries(entries):
+    global greatCircleCacheChanged, nightshadeCacheChanged
+    if not entries:
+        return
+    if entries['greatCircle']:
+        load_great_circle_cache()
+        greatCircleCache.update(entries['greatCircle'])
+        greatCircleCacheChanged = True
+        while len(greatCircleCache) > greatCircleCacheSize:
+            greatCircleCache.popitem(last=False)
+    if entries['nightshade']:
+        load_nightshade_cache()
+        nightshadeCache.update(entries['nightshade'])
+        nightshadeCacheChanged = True
+        while len(nightshadeCache) > nightshadeCacheSize:
+            nightshadeCache.popitem(last=False)
+
 # Function to fetch signal reports from PSK Reporter directly from the API
-def getSignalReports():
-    url = f"https://retrieve.pskreporter.info/query?receiverCallsign={myCallsign}&statistics=1&noactive=1&nolocator=0&flowStartSeconds={requestTime}"
+# Pass a session from create_http_session() to reuse the same connection between requests.
+# callsign is the receiving station to fetch the reports of, myCallsign by default.
+@timed_stage('fetch')
+def getSignalReports(session=None, callsign=None):
+    callsign = myCallsign if callsign is None else callsign
+    url = f"https://retrieve.pskreporter.info/query?receiverCallsign={callsign}&statistics=1&noactive=1&nolocator=0&flowStartSeconds={requestTime}"
     print(url)
-    response = requests.get(url)
+    response = (session or requests).get(url, timeout=requestTimeout)
     response.raise_for_status()
     xml_data = response.content
 
     root = ET.fromstring(xml_data)
     return root 
 
+# Fetches the reports of every station in myStations, one request after another over the same session, and returns
+# them merged into one receptionReports tree. A station that fails is reported and left out, if every station fails the
+# last error is raised.
+def getStationReports(session=None):
+    merged = ET.Element('receptionReports')
+    lastError = None
+    for callsign, _ in get_stations():
+        try:
+            reports = getSignalReports(session, callsign)
+        except (requests.RequestException, ET.ParseError) as e:
+            print(f"Could not fetch the reports of {callsign}: {e}")
+            lastError = e
+            continue
+        merged.extend(list(reports))
+    if lastError is not None and len(merged) == 0:
+        raise lastError
+    return merged
+
+# Saves fetched reports as a capture XML file in './pskr-xmldata/', like pskr-plot-retrievedata.sh does, so they can be
+# plotted again or archived later. Returns the file name.
+def save_capture_xml(reports, captureDatetime):
+    captureDatetime = captureDatetime.astimezone(timezone.utc) if captureDatetime.tzinfo is not None else captureDatetime
+    xml_file = Path('./pskr-xmldata/') / f"pskr-retrievedata-{format_datetime(captureDatetime, 'file')}.xml"
+    xml_file.parent.mkdir(parents=True, exist_ok=True)
+    tempFile = xml_file.with_name(f".{xml_file.name}.tmp")
+    ET.ElementTree(reports).write(tempFile, encoding='utf-8', xml_declaration=True)
+    os.replace(tempFile, xml_file)
+    return xml_file
+
+# Returns a requests session with a small connection pool, used by the long running scripts so each poll reuses the connection
+def create_http_session():
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    session.headers['User-Agent'] = 'PSKR-Plotter'
+    return session
+
+# Returns the XML files in './pskr-xmldata/', including the captures packed into archive bundles by pskr-plot-archive.py.
+# Archived captures are returned as ArchivedCapture entries, use open_xml_file() or the parse functions to read either kind.
 def get_xml_files():
     target_dir = Path('./pskr-xmldata/')
     files = list(target_dir.glob('*.xml'))
+    # A capture that is both loose and archived was left behind by an interrupted pskr-plot-archive.py run
+    looseNames = {xml_file.name for xml_file in files}
+    files += [capture for capture in get_archived_captures(target_dir) if capture.name not in looseNames]
     return files
 
+# One XML capture stored in an archive bundle: a gzip member of length bytes at offset in the bundle file.
+# It has the same name and stem as the XML file it was packed from, so it can be used wherever an XML file path is used.
+# mtime and size are those of the original XML file.
+class ArchivedCapture(namedtuple('ArchivedCapture', ['bundle', 'name', 'offset', 'length', 'mtime', 'size'])):
+    __slots__ = ()
+
+    @property
+    def stem(self):
+        return Path(self.name).stem
+
+    def __str__(self):
+        return f"{self.bundle}:{self.name}"
+
+# Returns the bundle file a capture taken at captureTime is packed into, one per day or per hour (see archivePeriod)
+def get_archive_bundle(directory, captureTime, period=None):
+    period = archivePeriod if period is None else period
+    if period == 'hour':
+        return Path(directory) / f"pskr-archive-{captureTime.strftime('%Y-%m-%dT%H')}.xml.gz"
+    if period == 'day':
+        return Path(directory) / f"pskr-archive-{captureTime.strftime('%Y-%m-%d')}.xml.gz"
+    raise ValueError(f"Unknown archive period: {period}. Use day or hour.")
+
+# The offset index of a bundle is kept next to it as JSON
+def get_archive_index_file(bundle):
+    return Path(bundle).with_name(Path(bundle).name.replace('.xml.gz', '.idx.json'))
+
+# Returns the file name and modification time stored in the header of a gzip member
+def read_gzip_member_header(member):
+    flags = member[3]
+    mtime = int.from_bytes(member[4:8], 'little')
+    position = 10
+    if flags & 4: # FEXTRA
+        position += 2 + int.from_bytes(member[10:12], 'little')
+    name = None
+    if flags & 8: # FNAME
+        end = bytes(member[position:position + 1024]).find(b'\0')
+        name = bytes(member[position:position + end]).decode('latin-1') if end >= 0 else None
+    return name, mtime
+
+# Rebuilds the offset index of a bundle from the gzip members, used when the index file is missing or broken.
+# A member cut short at the end of the bundle (an interrupted pskr-plot-archive.py run) is left out.
+def scan_archive_bundle(bundle):
+    with open(bundle, 'rb') as file:
+        data = memoryview(file.read())
+    captures = []
+    offset = 0
+    while offset < len(data):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        position, size = offset, 0
+        try:
+            while not decompressor.eof and position < len(data):
+                chunk = data[position:position + 65536]
+                size += len(decompressor.decompress(chunk))
+                position += len(chunk)
+        except zlib.error:
+            break
+        if not decompressor.eof:
+            break
+        length = position - len(decompressor.unused_data) - offset
+        name, mtime = read_gzip_member_header(data[offset:offset + length])
+        captures.append({'name': name or f"unnamed-{offset}.xml", 'offset': offset, 'length': length,
+                         # The gzip header only has whole seconds, see is_same_xml_file_signature()
+                         'mtime': mtime * 10**9, 'size': size})
+        offset += length
+    return captures
+
+# Returns the offset index of a bundle as a list of {name, offset, length, mtime, size} dictionaries
+def load_archive_index(bundle):
+    try:
+        with open(get_archive_index_file(bundle), 'r') as file:
+            captures = json.load(file)['captures']
+        if all(capture['offset'] + capture['length'] <= Path(bundle).stat().st_size for capture in captures):
+            return captures
+        print(f"The index of {bundle} does not match the bundle, rebuilding it.")
+    except FileNotFoundError:
+        print(f"No index found for {bundle}, rebuilding it.")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not read the index of {bundle}: {e}, rebuilding it.")
+    captures = scan_archive_bundle(bundle)
+    save_archive_index(bundle, captures)
+    return captures
+
+def save_archive_index(bundle, captures):
+    indexFile = get_archive_index_file(bundle)
+    tempFile = indexFile.with_name(indexFile.name + '.tmp')
+    with open(tempFile, 'w') as file:
+        json.dump({'captures': captures}, file)
+    os.replace(tempFile, indexFile)
+
+# Returns every capture in the archive bundles of a directory
+def get_archived_captures(directory='./pskr-xmldata/'):
+    captures = []
+    for bundle in sorted(Path(directory).glob('pskr-archive-*.xml.gz')):
+        captures += [ArchivedCapture(str(bundle), capture['name'], capture['offset'], capture['length'], capture['mtime'], capture['size'])
+                     for capture in load_archive_index(bundle)]
+    return captures
+
+# Opens an XML file or archived capture for reading and returns a binary file object.
+# An archived capture is read from its bundle and decompressed in memory, captures are small.
+def open_xml_file(xml_file):
+    if isinstance(xml_file, ArchivedCapture):
+        with open(xml_file.bundle, 'rb') as file:
+            file.seek(xml_file.offset)
+            member = file.read(xml_file.length)
+        return io.BytesIO(gzip.decompress(member))
+    return open(xml_file, 'rb')
+
+# Packs XML files into the archive bundles next to them, each file becomes one gzip member of the bundle for its day or hour.
+# The offset index is saved after the members are written and only then are the XML files deleted, so an interrupted run
+# never loses a capture. Files that are already archived are left in place. Returns the number of files packed.
+def archive_xml_files(xml_files, period=None, compressLevel=None):
+    compressLevel = archiveCompressLevel if compressLevel is None else compressLevel
+    bundles = {}
+    for xml_file in xml_files:
+        try:
+            bundles.setdefault(get_archive_bundle(xml_file.parent, get_time_from_xml(xml_file), period), []).append(xml_file)
+        except (IndexError, ValueError):
+            print(f"Could not read the capture time from the file name {xml_file}, file left in place.")
+
+    packed = 0
+    for bundle, bundleFiles in sorted(bundles.items()):
+        captures = load_archive_index(bundle) if bundle.exists() else []
+        archivedNames = {capture['name'] for capture in captures}
+        packedFiles = []
+        with open(bundle, 'ab') as file:
+            # Drop members written by a run that was interrupted before the index was saved
+            offset = max((capture['offset'] + capture['length'] for capture in captures), default=0)
+            file.truncate(offset)
+            for xml_file in sorted(bundleFiles, key=get_time_from_xml):
+                if xml_file.name in archivedNames:
+                    print(f"{xml_file.name} is already in {bundle.name}, file left in place.")
+                    continue
+                fileStat = xml_file.stat()
+                member = io.BytesIO()
+                with gzip.GzipFile(filename=xml_file.name, mode='wb', fileobj=member, compresslevel=compressLevel,
+                                   mtime=int(fileStat.st_mtime)) as memberFile:
+                    memberFile.write(xml_file.read_bytes())
+                file.write(member.getvalue())
+                captures.append({'name': xml_file.name, 'offset': offset, 'length': member.tell(),
+                                 'mtime': fileStat.st_mtime_ns, 'size': fileStat.st_size})
+                offset += member.tell()
+                packedFiles.append(xml_file)
+            file.flush()
+            os.fsync(file.fileno())
+        save_archive_index(bundle, captures)
+        for xml_file in packedFiles:
+            xml_file.unlink()
+        packed += len(packedFiles)
+    return packed
+
+@timed_stage('parse')
 def parse_xml_file(xml_file):
-    xml_string = ""
-    with open(xml_file, 'r') as file:
-        xml_string = file.read()
-    return ET.fromstring(xml_string)
+    with open_xml_file(xml_file) as file:
+        return ET.fromstring(file.read())
 
+# Merges several XML files into a single receptionReports tree.
+# Holds every report in memory, use iter_xml_reports() instead when the reports only need to be looped over once.
+@timed_stage('parse')
 def parse_xml_files(xml_files):
     print(f"Parsing {len(xml_files)} XML files... THIS MAY TAKE A WHILE")
-    xml_string = ""
-    for xml_file in xml_files:
-        with open(xml_file, 'r') as file:
-            xml_string += file.read()
-    #print(xml_string)
-
-    ## This is a hacky way to remove the XML declaration and receptionReports tags ##
-    xmlParts = xml_string.rsplit('</receptionReports>', -1)
-    #print(str(len(xmlParts)) + " XML parts found.")
-    new_xml_string = ''
-    for i in range(0, len(xmlParts)):
-        #print ("Range:" + str(i))
-        if i == 0:
-            new_xml_string += xmlParts[i].replace('</receptionReports>', '')
-        else:
-            replacement = xmlParts[i].replace('<?xml version="1.0"?>', '').replace('</receptionReports>', '')
-            #new_xml_string += xmlParts[i].replace('<?xml version="1.0"?>', '').replace('</receptionReports>', '')
-            new_xml_string += re.sub(r'^<receptionReports currentSeconds=\"\d*\">', '', replacement, flags=re.MULTILINE|re.IGNORECASE)
-
-    new_xml_string += '</receptionReports>'
+    merged = ET.Element('receptionReports')
+    for report in iter_xml_reports(xml_files, clear=False):
+        merged.append(report)
+    return merged
 
-    return ET.fromstring(new_xml_string)
+# Streams receptionReport elements one XML file at a time using ET.iterparse.
+# Each report is cleared once the caller moves on to the next one so memory stays flat no matter how many files are read,
+# read the attributes you need before the next iteration. Files that cannot be read are skipped, with skipErrors=False
+# the error is raised instead.
+def iter_xml_reports(xml_files, clear=True, skipErrors=True):
+    for xml_file in xml_files:
+        try:
+            with open_xml_file(xml_file) as file:
+                for event, element in ET.iterparse(file, events=('end',)):
+                    if element.tag != 'receptionReport':
+                        continue
+                    yield element
+                    if clear:
+                        element.clear()
+        except ET.ParseError as e:
+            if not skipErrors:
+                raise
+            # Cron captures can be empty or truncated if the API request failed
+            print(f"Could not parse XML file {xml_file}: {e}, file skipped.")
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            if not skipErrors:
+                raise
+            print(f"Could not read archived capture {xml_file}: {e}, file skipped.")
 
 def get_time_from_xml(xml_file):
     xml_datetime = xml_file.stem.split('pskr-retrievedata-')[1]
@@ -123,31 +861,36 @@ def format_datetime(thisDateTime, option='file'):
     else:
         raise ValueError("Invalid option. Use 'file' or 'plot'.")
 
+# PSK Reporter band colors, lower band edge in Hz, band name and line color. Keep this sorted from the highest band to the lowest.
+bandPlan = [
+    (56000000, '6m', '#FF0000'),
+    (28000000, '10m', '#ff69b4'),
+    (24890000, '12m', '#b22222'),
+    (21000000, '15m', '#cca166'),
+    (18068000, '17m', '#f2f261'),
+    (14000000, '20m', '#f2c40c'),
+    (10100000, '30m', '#62d962'),
+    (7000000, '40m', '#5959ff'),
+    (3500000, '80m', '#e550e5'),
+    (1800000, '160m', '#7cfc00'),
+]
+otherBandColor = 'grey' # Default color for other frequencies
+
+# RGBA lookup table for the band colors, indexed by get_band_indices(). The last row is used for other frequencies.
+bandColors = np.array([to_rgba(color) for _, _, color in bandPlan] + [to_rgba(otherBandColor)])
+
 # Returns a Hex color based on PSK Reporter band colors
 def getLineColor(frequency):
-    if frequency >= 56000000: # 6m band
-        return '#FF0000'
-    if frequency >= 28000000: # 10m band
-        return '#ff69b4'
-    elif frequency >= 24890000: # 12m band
-        return '#b22222'
-    elif frequency >= 21000000: # 15m band
-        return '#cca166'
-    elif frequency >= 18068000: # 17m band
-        return '#f2f261'
-    elif frequency >= 14000000: # 20m band
-        return '#f2c40c'
-    elif frequency >= 10100000: # 30m band
-        return '#62d962'
-    elif frequency >= 7000000: # 40m band
-        return "#5959ff"
-    elif frequency >= 3500000: # 80m band
-        return '#e550e5'
-    elif frequency >= 1800000: # 160m band
-        return '#7cfc00'
-    else:
-        return 'grey' # Default color for other frequencies
-    
+    for lowerEdge, bandName, color in bandPlan:
+        if frequency >= lowerEdge:
+            return color
+    return otherBandColor
+
+# Returns the bandPlan index for each frequency in an array, frequencies below the lowest band get len(bandPlan)
+def get_band_indices(frequencies):
+    lowerEdges = np.array([lowerEdge for lowerEdge, _, _ in bandPlan[::-1]])
+    return len(bandPlan) - np.searchsorted(lowerEdges, np.asarray(frequencies), side='right')
+
 # This function returns a hex color with alpha transparency based on frequency and SNR
 # Using the range of SNR values from -23 to 10 dB to map to alpha transparency
 def get_marker_transparency(frequency, snr):
@@ -164,6 +907,12 @@ def get_marker_transparency(frequency, snr):
     # Combine base color with alpha transparency
     return f"{base_color}{alphaHex}"
 
+# Array version of get_marker_transparency, returns an (N, 4) array of RGBA marker colors
+def get_marker_colors(frequencies, snrs):
+    colors = bandColors[get_band_indices(frequencies)]
+    colors[:, 3] = interp(np.asarray(snrs, dtype=float), [-23, 10], [0, 255]).astype(int) / 255
+    return colors
+
 def get_report_attributes(thisReport):
     try:
         callsign = thisReport.attrib['senderCallsign'] if thisReport.attrib['senderCallsign'] is not None else 'N/A'
@@ -174,18 +923,113 @@ def get_report_attributes(thisReport):
     except KeyError as e:
         print(f"Missing attribute in report: {e}, result discarded.")
         return None, None, None, None, None
+    except ValueError as e:
+        print(f"Invalid attribute in report: {e}, result discarded.")
+        return None, None, None, None, None
     else:
         return callsign, frequency, senderLocator, receiverLocator, signal_strength
 
+# Returns True when the attributes from get_report_attributes() are complete enough to plot the report.
+# An SNR of 0 dB is a valid report, only a missing SNR makes it incomplete.
+def is_complete_report(callsign, frequency, senderLocator, receiverLocator, signal_strength):
+    return bool(callsign and frequency and senderLocator and receiverLocator) and signal_strength is not None
+
 def get_lat_lon_from_locator(locator):
     if locator is None or len(locator) < 4:
         print(f"Invalid locator: {locator}. Locator must be at least 4 characters long.")
         return None, None
-    else:
-        # Reverse latitude and longitude order for Cartopy/Matplotlib compatibility which requires longitude first
-        coords = mh.to_location(locator, center=True)
-        return coords[1], coords[0]
-    
+    coords = decode_locator(locator)
+    if coords is None:
+        print(f"Invalid locator: {locator}.")
+        return None, None
+    # Longitude first for Cartopy/Matplotlib compatibility
+    return coords[0], coords[1]
+
+# Least recently used table of decoded locators, see get_lat_lon_from_locators()
+locatorCache = OrderedDict()
+
+# Maidenhead character pairs: number of divisions of the previous pair and whether the pair is letters or digits
+locatorPairDivisions = np.array([18, 10, 24, 10, 24])
+locatorPairIsLetter = np.array([True, False, True, False, True])
+# Longitude size in degrees of one step in each pair, latitude steps are half of this
+locatorPairLonSize = 360 / np.cumprod(locatorPairDivisions)
+locatorMaxLength = 2 * len(locatorPairDivisions)
+# The same as plain Python values for decode_locator(): divisions, first character and longitude step size of each pair
+locatorPairs = [(divisions, ord('A') if isLetter else ord('0'), lonSize) for divisions, isLetter, lonSize
+                in zip(locatorPairDivisions.tolist(), locatorPairIsLetter.tolist(), locatorPairLonSize.tolist())]
+
+# Decodes one Maidenhead locator to the center of its grid square, like decode_locators() but without the NumPy overhead
+# that dominates for a single locator. Returns (longitude, latitude), or None for an invalid locator.
+def decode_locator(locator):
+    locator = locator.strip().upper()
+    if len(locator) % 2 or not 4 <= len(locator) <= locatorMaxLength:
+        return None
+    lon = lat = 0.0
+    for pair, (divisions, zeroChar, lonSize) in enumerate(locatorPairs[:len(locator) // 2]):
+        lonValue = ord(locator[2 * pair]) - zeroChar
+        latValue = ord(locator[2 * pair + 1]) - zeroChar
+        if not (0 <= lonValue < divisions and 0 <= latValue < divisions):
+            return None
+        lon += lonValue * lonSize
+        lat += latValue * lonSize
+    # Move from the south west corner to the center of the smallest square given
+    return -180 + lon + lonSize / 2, -90 + (lat + lonSize / 2) / 2
+
+# Decodes an array of Maidenhead locators to the center of their grid squares in one NumPy pass.
+# Returns an (N, 2) array of longitude/latitude, invalid locators decode to NaN.
+def decode_locators(locators):
+    locators = np.char.upper(np.char.strip(np.asarray(locators, dtype=str)))
+    lengths = np.char.str_len(locators)
+    pairCount = lengths // 2
+
+    # Unicode code points of each character, one column per character
+    chars = locators.astype(f'U{locatorMaxLength}').view(np.uint32).reshape(len(locators), locatorMaxLength).astype(np.int64)
+    zeroChar = np.where(locatorPairIsLetter, ord('A'), ord('0'))
+    lonValues = chars[:, 0::2] - zeroChar
+    latValues = chars[:, 1::2] - zeroChar
+
+    usedPairs = np.arange(len(locatorPairDivisions)) < pairCount[:, None]
+    validPairs = (lonValues >= 0) & (lonValues < locatorPairDivisions) & (latValues >= 0) & (latValues < locatorPairDivisions)
+    valid = (lengths % 2 == 0) & (lengths >= 4) & (lengths <= locatorMaxLength) & (validPairs | ~usedPairs).all(axis=1)
+
+    lonValues = np.where(usedPairs, lonValues, 0)
+    latValues = np.where(usedPairs, latValues, 0)
+    # Move from the south west corner to the center of the smallest square given
+    centerOffset = locatorPairLonSize[np.clip(pairCount - 1, 0, len(locatorPairDivisions) - 1)] / 2
+    lons = -180 + lonValues @ locatorPairLonSize + centerOffset
+    lats = -90 + (latValues @ locatorPairLonSize + centerOffset) / 2
+
+    coords = np.column_stack([lons, lats])
+    coords[~valid] = np.nan
+    return coords
+
+# Array version of get_lat_lon_from_locator, returns an (N, 2) array of longitude/latitude with NaN for invalid locators.
+# Each distinct locator is only decoded once, repeated grids (like your own receiver locator) come from the locator cache.
+@timed_stage('locators')
+def get_lat_lon_from_locators(locators):
+    locators = np.asarray(locators, dtype=str).reshape(-1)
+    uniqueLocators, inverse = np.unique(locators, return_inverse=True)
+
+    uniqueCoords = np.empty((len(uniqueLocators), 2))
+    missing = []
+    for index, locator in enumerate(uniqueLocators):
+        coords = locatorCache.get(locator)
+        if coords is None:
+            missing.append(index)
+        else:
+            locatorCache.move_to_end(locator)
+            uniqueCoords[index] = coords
+
+    if missing:
+        count_stat('locators_decoded', len(missing))
+        uniqueCoords[missing] = decode_locators(uniqueLocators[missing])
+        for index in missing:
+            locatorCache[uniqueLocators[index]] = uniqueCoords[index]
+        while len(locatorCache) > locatorCacheSize:
+            locatorCache.popitem(last=False)
+
+    return uniqueCoords[inverse.reshape(-1)]
+
 def plot_signal_path(ax, coords, QTHcoords, frequency, signal_strength):
     if coords is None or QTHcoords is None:
         print("Invalid coordinates for plotting signal path.")
@@ -203,7 +1047,871 @@ def plot_qth_locator(ax, QTHcoords):
     
     ax.plot(QTHcoords[0], QTHcoords[1], '^', color='blue', markersize=3, transform=ccrs.Geodetic(), label='QTH Locator')
 
-def add_title_and_text(plt, ax, current_date):
-    plt.title('PSK Reporter Signal Reports')
+# Interpolates points along the great circle between two arrays of longitude/latitude pairs (in degrees).
+# Returns two (N, numPoints) arrays of longitudes and latitudes.
+def get_great_circle_points(lons1, lats1, lons2, lats2, numPoints=greatCirclePoints):
+    lons1, lats1, lons2, lats2 = (np.radians(np.asarray(values, dtype=float)) for values in (lons1, lats1, lons2, lats2))
+    start = np.stack([np.cos(lats1) * np.cos(lons1), np.cos(lats1) * np.sin(lons1), np.sin(lats1)], axis=-1)
+    end = np.stack([np.cos(lats2) * np.cos(lons2), np.cos(lats2) * np.sin(lons2), np.sin(lats2)], axis=-1)
+
+    # Spherical linear interpolation between the two unit vectors
+    omega = np.arccos(np.clip(np.sum(start * end, axis=-1), -1, 1))[:, None]
+    steps = np.linspace(0, 1, numPoints)[None, :]
+    sinOmega = np.sin(omega)
+    samePoint = sinOmega[:, 0] < 1e-9
+    sinOmega[samePoint] = 1
+    startWeight = np.sin((1 - steps) * omega) / sinOmega
+    endWeight = np.sin(steps * omega) / sinOmega
+    # Both ends are in the same grid square, fall back to a straight line
+    startWeight[samePoint] = 1 - steps
+    endWeight[samePoint] = steps
+
+    points = startWeight[..., None] * start[:, None, :] + endWeight[..., None] * end[:, None, :]
+    lons = np.degrees(np.arctan2(points[..., 1], points[..., 0]))
+    lats = np.degrees(np.arctan2(points[..., 2], np.hypot(points[..., 0], points[..., 1])))
+    return lons, lats
+
+# Projects great circle signal paths onto the map projection in one pass.
+# Returns a list with one entry per path, each entry is a list of (numPoints, 2) line segments in projection coordinates.
+# Paths that cross the edge of the map are split in two so they do not get drawn across the whole map.
+def project_great_circle_paths(projection, lons1, lats1, lons2, lats2, numPoints=greatCirclePoints):
+    lons, lats = get_great_circle_points(lons1, lats1, lons2, lats2, numPoints)
+    geodetic = ccrs.Geodetic()
+    projected = projection.transform_points(geodetic, lons.ravel(), lats.ravel())[:, :2].reshape(lons.shape + (2,))
+
+    # Longitudes relative to the center of the map, a jump of more than 180 degrees means the path crosses the map edge
+    centralLongitude = projection.proj4_params.get('lon_0', 0)
+    relativeLons = (lons - centralLongitude + 180) % 360 - 180
+    crossings = np.abs(np.diff(relativeLons, axis=1)) > 180
+
+    paths = [[path] for path in projected]
+    for row in np.flatnonzero(crossings.any(axis=1)):
+        step = np.flatnonzero(crossings[row])[0]
+        lonBefore, lonAfter = relativeLons[row, step], relativeLons[row, step + 1]
+        latBefore, latAfter = lats[row, step], lats[row, step + 1]
+        edge = 180 if lonBefore > 0 else -180
+
+        # Latitude where the path meets the map edge, then project that point on both sides of the map
+        fraction = abs(edge - lonBefore) / (abs(edge - lonBefore) + abs(lonAfter + edge))
+        latEdge = latBefore + fraction * (latAfter - latBefore)
+        edgeLons = centralLongitude + np.array([edge, -edge]) * (1 - 1e-9)
+        edgePoints = projection.transform_points(geodetic, edgeLons, np.array([latEdge, latEdge]))[:, :2]
+
+        paths[row] = [np.vstack([projected[row, :step + 1], edgePoints[0]]), np.vstack([edgePoints[1], projected[row, step + 1:]])]
+
+    return paths
+
+# Least recently used cache of projected signal paths, see get_great_circle_paths()
+greatCircleCache = OrderedDict()
+greatCircleCacheLoaded = False
+greatCircleCacheChanged = False
+
+# Loads a least recently used cache saved by save_lru_cache() into cache, keeping at most maxSize entries
+def load_lru_cache(cache, cacheFile, maxSize, description):
+    if cacheFile is None or not Path(cacheFile).exists():
+        return
+    # A damaged or outdated pickle can raise almost any exception, the cache is then rebuilt
+    try:
+        with open(cacheFile, 'rb') as file:
+            merged = OrderedDict(pickle.load(file))
+    except Exception as e:
+        print(f"Could not read {description} cache {cacheFile}: {e}, starting with an empty cache.")
+        return
+    # The saved entries keep their order from oldest to newest. Entries added before the file was loaded are newer,
+    # they go after them at the recently used end.
+    merged.update(cache)
+    for key in cache:
+        merged.move_to_end(key)
+    while len(merged) > maxSize:
+        merged.popitem(last=False)
+    cache.clear()
+    cache.update(merged)
+
+# Saves a least recently used cache to cacheFile
+def save_lru_cache(cache, cacheFile):
+    cacheFile = Path(cacheFile)
+    cacheFile.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so an interrupted run never leaves a half written cache behind. The process id keeps
+    # scripts that save the same cache at the same time from writing into each other's temporary file.
+    tempFile = cacheFile.with_name(f'{cacheFile.name}.{os.getpid()}.tmp')
+    with open(tempFile, 'wb') as file:
+        pickle.dump(dict(cache), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tempFile, cacheFile)
+
+# Loads the saved great circle cache from greatCircleCacheFile, only reads the file once per run
+def load_great_circle_cache():
+    global greatCircleCacheLoaded
+    if greatCircleCacheLoaded:
+        return
+    greatCircleCacheLoaded = True
+    load_lru_cache(greatCircleCache, greatCircleCacheFile, greatCircleCacheSize, 'great circle')
+
+# Saves the great circle cache to greatCircleCacheFile if anything was added since it was loaded
+def save_great_circle_cache():
+    global greatCircleCacheChanged
+    if greatCircleCacheFile is None or not greatCircleCacheChanged:
+        return
+    save_lru_cache(greatCircleCache, greatCircleCacheFile)
+    greatCircleCacheChanged = False
+
+# Returns projected signal paths (same layout as project_great_circle_paths) for pairs of sender/receiver locators.
+# Paths are looked up in the great circle cache by projection and locator pair, only missing pairs are projected.
+@timed_stage('great_circles')
+def get_great_circle_paths(projection, senderLocators, receiverLocators, senderCoords, receiverCoords):
+    global greatCircleCacheChanged
+    load_great_circle_cache()
+
+    projectionKey = projection.proj4_init
+    keys = [(projectionKey, greatCirclePoints, senderLocator.upper(), receiverLocator.upper())
+            for senderLocator, receiverLocator in zip(senderLocators, receiverLocators)]
+
+    paths = [None] * len(keys)
+    missingRows = {}
+    for row, key in enumerate(keys):
+        path = greatCircleCache.get(key)
+        if path is None:
+            missingRows.setdefault(key, row)
+        else:
+            greatCircleCache.move_to_end(key)
+            paths[row] = path
+
+    count_stat('great_circle_cache_misses', len(missingRows))
+    count_stat('great_circle_cache_hits', len(keys) - sum(1 for path in paths if path is None))
+    if missingRows:
+        rows = np.fromiter(missingRows.values(), dtype=int, count=len(missingRows))
+        newPaths = project_great_circle_paths(projection, senderCoords[rows, 0], senderCoords[rows, 1],
+                                              receiverCoords[rows, 0], receiverCoords[rows, 1])
+        newPaths = {key: [segment.astype(np.float32) for segment in path] for key, path in zip(missingRows, newPaths)}
+        greatCircleCache.update(newPaths)
+        greatCircleCacheChanged = True
+        if newCacheKeys is not None:
+            newCacheKeys['greatCircle'].update(newPaths)
+        while len(greatCircleCache) > greatCircleCacheSize:
+            greatCircleCache.popitem(last=False)
+        for row, key in enumerate(keys):
+            if paths[row] is None:
+                paths[row] = newPaths[key]
+
+    return paths
+
+# Batch version of plot_signal_path, draws every signal path at once.
+# senderCoords and receiverCoords are (N, 2) arrays of longitude/latitude, rows with missing coordinates are skipped.
+# Draws one LineCollection and one scatter of sender markers per band instead of one Line2D per report.
+# If senderLocators and receiverLocators are given the paths are looked up in the great circle cache.
+@timed_stage('plot_paths')
+def plot_signal_paths(ax, senderCoords, receiverCoords, frequencies, snrs, senderLocators=None, receiverLocators=None):
+    senderCoords = np.asarray(senderCoords, dtype=float).reshape(-1, 2)
+    receiverCoords = np.asarray(receiverCoords, dtype=float).reshape(-1, 2)
+    frequencies = np.asarray(frequencies)
+    snrs = np.asarray(snrs)
+    useCache = senderLocators is not None and receiverLocators is not None
+    if useCache:
+        senderLocators = np.asarray(senderLocators, dtype=str)
+        receiverLocators = np.asarray(receiverLocators, dtype=str)
+
+    valid = np.isfinite(senderCoords).all(axis=1) & np.isfinite(receiverCoords).all(axis=1)
+    if not valid.all():
+        print(f"Invalid coordinates for plotting {np.count_nonzero(~valid)} signal path(s), skipped.")
+        count_stat('reports_skipped', np.count_nonzero(~valid))
+        senderCoords, receiverCoords, frequencies, snrs = senderCoords[valid], receiverCoords[valid], frequencies[valid], snrs[valid]
+        if useCache:
+            senderLocators, receiverLocators = senderLocators[valid], receiverLocators[valid]
+    count_stat('reports_plotted', len(senderCoords))
+    if len(senderCoords) == 0:
+        return
+
+    projection = ax.projection
+    if useCache:
+        paths = get_great_circle_paths(projection, senderLocators, receiverLocators, senderCoords, receiverCoords)
+    else:
+        paths = project_great_circle_paths(projection, senderCoords[:, 0], senderCoords[:, 1], receiverCoords[:, 0], receiverCoords[:, 1])
+    senderPoints = projection.transform_points(ccrs.Geodetic(), senderCoords[:, 0], senderCoords[:, 1])[:, :2]
+    bandIndices = get_band_indices(frequencies)
+    markerColors = get_marker_colors(frequencies, snrs)
+
+    for bandIndex in np.unique(bandIndices):
+        rows = np.flatnonzero(bandIndices == bandIndex)
+        bandName = bandPlan[bandIndex][1] if bandIndex < len(bandPlan) else 'Other'
+        segments = [segment for row in rows for segment in paths[row]]
+
+        ax.add_collection(LineCollection(segments, colors=[bandColors[bandIndex]], linewidths=0.7, zorder=2,
+                                         label=f'{bandName} Signal Paths'), autolim=False)
+        ax.scatter(senderPoints[rows, 0], senderPoints[rows, 1], s=9, c=markerColors[rows], edgecolors='black',
+                   linewidths=0.5, zorder=3, transform=projection, label=f'{bandName} Senders')
+
+# Batch version of plot_qth_locator, draws each distinct receiver location once
+@timed_stage('plot_paths')
+def plot_qth_locators(ax, QTHcoords):
+    QTHcoords = np.asarray(QTHcoords, dtype=float).reshape(-1, 2)
+    QTHcoords = np.unique(QTHcoords[np.isfinite(QTHcoords).all(axis=1)], axis=0)
+    if len(QTHcoords) == 0:
+        print("Invalid QTH coordinates for plotting.")
+        return
+
+    projection = ax.projection
+    points = projection.transform_points(ccrs.Geodetic(), QTHcoords[:, 0], QTHcoords[:, 1])[:, :2]
+    ax.plot(points[:, 0], points[:, 1], '^', color='blue', markersize=3, zorder=4, transform=projection, label='QTH Locator')
+
+def add_title_and_text(plt, ax, current_date, station=None):
+    ax.set_title('PSK Reporter Signal Reports' + (f" - {station}" if station else ''))
     textbox = AnchoredText(f"Data from PSK Reporter  Date: {current_date.strftime('%Y-%m-%d %H:%M:%S UTC')}", loc="lower center", prop=dict(alpha=0.8, size=8))
-    ax.add_artist(textbox)
\ No newline at end of file
+    ax.add_artist(textbox)
+
+# Output file name for a plot, based on the date and time of the data and the station callsign when several are plotted.
+# The extension is the image format of the render profile.
+def get_plot_filename(plotDatetime, station=None):
+    stationTag = f"{get_station_file_tag(station)}." if station else ''
+    return f"./plots/psk_reporter_signal_reports.{stationTag}{format_datetime(plotDatetime, 'file')}.{outputFormat}"
+
+# Callsign as it is used in file names, portable callsigns like KE7BUA/P contain a slash
+def get_station_file_tag(station):
+    return station.replace('/', '-')
+
+# Splits receptionReport elements by receiving station in one pass over the reports.
+# Returns a list of (station callsign, reports) with one entry per station in myStations, or [(None, all the reports)]
+# when only one station is configured.
+def split_reports_by_station(receptionReports):
+    stations = get_frame_stations()
+    if stations == [None]:
+        return [(None, receptionReports)]
+    groups = {station: [] for station in stations}
+    for report in receptionReports:
+        group = groups.get(report.attrib.get('receiverCallsign', '').upper())
+        if group is not None:
+            group.append(report)
+    return list(groups.items())
+
+# Plots a list of receptionReport elements onto the map in one batch. Returns the number of reports plotted and skipped.
+def plot_reception_reports(ax, receptionReports, verbose=True):
+    # Signal paths are collected here and plotted in one batch after all the reports are read
+    frequencies, snrs, senderLocators, receiverLocators = [], [], [], []
+    skipped = 0
+    parsed = 0
+    total = len(receptionReports) if hasattr(receptionReports, '__len__') else None
+    printReports = verbose and printEachReport
+
+    with stage_timer('attributes'):
+        for report in receptionReports:
+            parsed += 1
+            # Only look at the clock every 1000 reports, printing or timing every report costs more than reading it
+            if verbose and not printReports and parsed % 1000 == 0:
+                report_progress('Reading reports', parsed, total)
+
+            # Get the attributes from the a single reception report
+            callsign, frequency, senderLocator, receiverLocator, signal_strength = get_report_attributes(report)
+
+            if not is_complete_report(callsign, frequency, senderLocator, receiverLocator, signal_strength):
+                skipped += 1
+                if printReports:
+                    print("Skipping incomplete report.")
+                continue # If any atributes are missing, skip plotting this report
+
+            if printReports:
+                print(f"Callsign: {callsign}, Locator: {senderLocator}, SNR: {signal_strength}")
+                print("Adding to map...")
+
+            # Queue the signal path for plotting
+            frequencies.append(frequency)
+            snrs.append(signal_strength)
+            senderLocators.append(senderLocator)
+            receiverLocators.append(receiverLocator)
+
+    count_stat('reports_parsed', parsed)
+    count_stat('reports_skipped', skipped)
+    if verbose:
+        print(f"Read {parsed} reports, {skipped} incomplete reports skipped.")
+
+    # Convert all the Maidenhead locators to longitude and latitude in one pass (This order is important for plotting)
+    senderCoords = get_lat_lon_from_locators(senderLocators)
+    receiverCoords = get_lat_lon_from_locators(receiverLocators)
+
+    # Plot all the signal paths and the QTH locator on the map
+    plot_signal_paths(ax, senderCoords, receiverCoords, frequencies, snrs, senderLocators, receiverLocators)
+    plot_qth_locators(ax, receiverCoords)
+    return len(frequencies), skipped
+
+# Saves a figure without ever leaving a half written file behind. The figure is written to a temporary file in the
+# same directory first and then renamed over the output file, so anything watching the plots directory only sees complete files.
+@timed_stage('savefig')
+def save_figure_atomic(fig, outputFile, **kwargs):
+    outputFile = Path(outputFile)
+    tempFile = outputFile.with_name(f".{outputFile.stem}.tmp{outputFile.suffix}")
+    try:
+        fig.savefig(tempFile, **kwargs)
+        os.replace(tempFile, outputFile)
+        count_stat('frames_saved')
+    finally:
+        tempFile.unlink(missing_ok=True)
+
+# Draws one plot of a list of receptionReport elements and returns the axes. The figure and basemap from the previous
+# call are reused so only the nightshade and signal layers are drawn again.
+def draw_reports_frame(receptionReports, frameDatetime, verbose=True, dpi=None, station=None):
+    ax = setup_plot(reuseFigure=True, dpi=dpi)
+
+    # Set the day/night shading based on the date and time of the data
+    add_nightshade(ax, frameDatetime)
+
+    plot_reception_reports(ax, receptionReports, verbose)
+
+    # Add title and text to the plot
+    add_title_and_text(plt, ax, frameDatetime, station)
+    return ax
+
+# Draws and saves one plot of a list of receptionReport elements
+def plot_reports_frame(receptionReports, frameDatetime, outputFile, verbose=True, station=None):
+    ax = draw_reports_frame(receptionReports, frameDatetime, verbose, station=station)
+    save_figure_atomic(ax.figure, outputFile, **get_savefig_kwargs(ax.figure))
+    return outputFile
+
+# Draws and saves one plot per station (see split_reports_by_station) to './plots/' with a timestamp.
+# The figure, basemap and caches are shared by all the stations. Returns the file names of the saved plots.
+def plot_station_frames(receptionReports, frameDatetime, verbose=True):
+    outputFiles = []
+    for station, stationReports in split_reports_by_station(receptionReports):
+        if verbose and station:
+            print(f"Plotting {len(stationReports)} reports received by {station}")
+        outputFiles.append(plot_reports_frame(stationReports, frameDatetime, get_plot_filename(frameDatetime, station), verbose, station))
+    return outputFiles
+
+# Draws and saves the plots for a single XML file, the body of the pskr-plot-xmldata.py loop.
+# Returns the file names of the saved plots, one per station.
+def plot_xml_file(xml_file, verbose=True):
+    xml_datetime = get_time_from_xml(xml_file)
+    if verbose:
+        print("XML Datetime: " + format_datetime(xml_datetime, 'console'))
+        print(f"Parsing XML file: {xml_file}")
+
+    reports = parse_xml_file(xml_file)
+    return plot_station_frames(reports.findall('.//receptionReport'), xml_datetime, verbose)
+
+# Loads everything a run of several plots keeps between frames: the Agg backend, the basemap, the great circle and nightshade caches
+def warm_render_caches(dpi=None):
+    plt.switch_backend('Agg')
+    if useBasemapCache:
+        get_basemap(coastlineBorderResolution, coastlineBorderWidth, countrylineBorderWidth, get_output_dpi() if dpi is None else dpi)
+    load_great_circle_cache()
+    load_nightshade_cache()
+
+# Sets up a worker process for parallel rendering. Each worker keeps its own Agg figure and basemap between frames.
+# profileArguments is the activeRenderProfile of the main process, so the workers save the plots the same way.
+def init_render_worker(dpi=None, profileArguments=None):
+    global newCacheKeys
+    # Ctrl+C goes to the whole process group. The main process catches it, cancels the queued files and lets the
+    # workers finish the plot in progress, so they ignore it here.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The new cache entries are sent back with each result, the workers do not save the caches themselves
+    newCacheKeys = {'greatCircle': set(), 'nightshade': set()}
+    if profileArguments is not None:
+        apply_render_profile(*profileArguments)
+    warm_render_caches(dpi)
+
+# Renders one XML file without letting an error stop the rest of the run.
+# Returns the XML file, the list of saved plot file names (None on failure), an error message (None on success), the run
+# statistics of this plot, which the caller adds to its own with merge_run_stats() (they come from another process
+# when rendering in parallel), and the new cache entries of a worker process for merge_new_cache_entries().
+def render_xml_file(xml_file, verbose=False):
+    try:
+        return xml_file, plot_xml_file(xml_file, verbose), None, take_run_stats(), take_new_cache_entries()
+    except Exception as e:
+        return xml_file, None, f"{type(e).__name__}: {e}", take_run_stats(), take_new_cache_entries()
+
+# Returns the dpi and the bounding box (in inches) of video frames that are videoWidth (or width) pixels wide. Like the
+# PNG files they are cropped to the map, title and text box, the frame height follows from the map projection.
+def get_video_layout(width=None):
+    return get_size_layout(videoWidth if width is None else width, None)
+
+# Draws the current figure at the given dpi and returns a copy of the pixels inside bbox (in inches, from
+# get_video_layout()) as a (height, width, 4) RGBA array. Where bbox reaches past the figure the frame is white.
+@timed_stage('render_frame')
+def render_frame_rgba(fig, dpi, bbox):
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    # Pixel rows are counted from the top of the figure
+    left = round(bbox.x0 * dpi)
+    top = round((fig.get_figheight() - bbox.y1) * dpi)
+    frame = np.full((round(bbox.height * dpi), round(bbox.width * dpi), 4), 255, dtype=np.uint8)
+    source = rgba[max(0, top):top + frame.shape[0], max(0, left):left + frame.shape[1]]
+    frame[max(0, -top):max(0, -top) + source.shape[0], max(0, -left):max(0, -left) + source.shape[1]] = source
+    return frame
+
+# Renders one XML file to RGBA video frames, one per station, without letting an error stop the rest of the run.
+# dpi and bbox come from get_video_layout().
+# Returns the XML file, a list of (station, frame) pairs (None on failure), an error message (None on success), the
+# run statistics and the new cache entries like render_xml_file().
+def render_xml_file_frame(xml_file, dpi, bbox, verbose=False):
+    try:
+        xml_datetime = get_time_from_xml(xml_file)
+        reports = parse_xml_file(xml_file)
+        frames = []
+        for station, stationReports in split_reports_by_station(reports.findall('.//receptionReport')):
+            ax = draw_reports_frame(stationReports, xml_datetime, verbose, dpi, station)
+            frames.append((station, render_frame_rgba(ax.figure, dpi, bbox)))
+        return xml_file, frames, None, take_run_stats(), take_new_cache_entries()
+    except Exception as e:
+        return xml_file, None, f"{type(e).__name__}: {e}", take_run_stats(), take_new_cache_entries()
+
+# Opens a video file for frames of width x height RGBA pixels, the file type follows from the extension (.mp4, .mkv, .gif, ...).
+# Frames are piped straight into an ffmpeg process. Without ffmpeg only GIF files can be written, the frames are then
+# collected in memory and saved with Pillow when the writer is closed.
+def open_video_writer(outputFile, width, height, fps=videoFps):
+    outputFile = Path(outputFile)
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        if outputFile.suffix.lower() != '.gif':
+            raise RuntimeError("ffmpeg was not found, install it or use a .gif output file.")
+        print("ffmpeg was not found, the GIF file will be written with Pillow.")
+        return {'outputFile': outputFile, 'size': (height, width), 'fps': fps, 'process': None, 'frames': []}
+
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+               '-framerate', str(fps), '-i', '-']
+    if outputFile.suffix.lower() == '.gif':
+        command += ['-vf', 'split[frames][source];[source]palettegen[palette];[frames][palette]paletteuse']
+    else:
+        # H.264 needs even frame sizes
+        command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-preset', 'medium', '-pix_fmt', 'yuv420p']
+    command.append(str(outputFile))
+    return {'outputFile': outputFile, 'size': (height, width), 'fps': fps,
+            'process': subprocess.Popen(command, stdin=subprocess.PIPE), 'frames': None}
+
+# Adds one RGBA frame (from render_frame_rgba) to a video writer
+@timed_stage('encode_video')
+def write_video_frame(writer, rgba):
+    height, width = writer['size']
+    if rgba.shape[:2] != (height, width):
+        # Every frame has to be the same size, crop or pad with white if the layout moved by a pixel
+        frame = np.full((height, width, 4), 255, dtype=np.uint8)
+        frame[:min(height, rgba.shape[0]), :min(width, rgba.shape[1])] = rgba[:height, :width]
+        rgba = frame
+    count_stat('video_frames')
+    if writer['process'] is not None:
+        writer['process'].stdin.write(rgba.tobytes())
+    else:
+        # Keep the GIF frames palette based so they take a quarter of the memory
+        writer['frames'].append(Image.fromarray(rgba).convert('RGB').quantize(colors=256))
+
+# Finishes the video file, raises RuntimeError if ffmpeg failed
+def close_video_writer(writer):
+    if writer['process'] is not None:
+        writer['process'].stdin.close()
+        if writer['process'].wait() != 0:
+            raise RuntimeError(f"ffmpeg could not write {writer['outputFile']}")
+    elif writer['frames']:
+        writer['frames'][0].save(writer['outputFile'], save_all=True, append_images=writer['frames'][1:],
+                                 duration=int(1000 / writer['fps']), loop=0)
+
+# Returns a short hash of every setting that changes how a plot looks.
+# Plots made with a different hash are out of date and get rendered again by incremental runs.
+def get_render_config_hash():
+    settings = {
+        'projection': set_map_projection().proj4_init,
+        'coastlineBorderResolution': coastlineBorderResolution,
+        'coastlineBorderWidth': coastlineBorderWidth,
+        'countrylineBorderWidth': countrylineBorderWidth,
+        'figureSize': list(figureSize),
+        'outputDpi': get_output_dpi(),
+        'greatCirclePoints': greatCirclePoints,
+        'bandPlan': bandPlan,
+        'otherBandColor': otherBandColor,
+        'stations': get_frame_stations(),
+        'output': {'antialiased': outputAntialiased, 'format': outputFormat, 'size': list(outputSize) if outputSize else None},
+    }
+    # The PNG compression level does not change the pixels, the quality only matters for the lossy formats
+    if outputFormat != 'png':
+        settings['output']['quality'] = outputQuality
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+# Returns the modification time and size of an XML file, a change in either means the file has to be plotted again
+def get_xml_file_signature(xml_file):
+    # Archived captures keep the signature of the XML file they were packed from, so packing does not make plots out of date
+    if isinstance(xml_file, ArchivedCapture):
+        return {'mtime': xml_file.mtime, 'size': xml_file.size}
+    fileStat = os.stat(xml_file)
+    return {'mtime': fileStat.st_mtime_ns, 'size': fileStat.st_size}
+
+# Returns True when a signature saved from get_xml_file_signature() still matches the XML file. Archived captures are
+# compared to the second, an index rebuilt from the gzip headers of a bundle only has the whole second.
+def is_same_xml_file_signature(signature, xml_file):
+    if signature is None:
+        return False
+    current = get_xml_file_signature(xml_file)
+    if isinstance(xml_file, ArchivedCapture):
+        return signature.get('size') == current['size'] and signature.get('mtime', -1) // 10**9 == current['mtime'] // 10**9
+    return signature == current
+
+# Returns the render manifest key of an XML file, an archived capture has the key of the XML file it was packed from
+def get_xml_file_key(xml_file):
+    if isinstance(xml_file, ArchivedCapture):
+        return str(Path(xml_file.bundle).parent / xml_file.name)
+    return str(xml_file)
+
+# Loads the render manifest, a dictionary of XML file name to the signature, config hash and plot file it was rendered with.
+# Entries made with different settings are dropped so every plot gets rendered again after a settings change.
+def load_render_manifest(configHash=None):
+    configHash = get_render_config_hash() if configHash is None else configHash
+    try:
+        with open(renderManifestFile, 'r') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Could not read render manifest {renderManifestFile}: {e}, every XML file will be plotted.")
+        return {}
+    frames = manifest.get('frames', {})
+    return {source: entry for source, entry in frames.items() if entry.get('configHash') == configHash}
+
+# Saves the render manifest, written to a temporary file first so an interrupted run never leaves a broken manifest
+def save_render_manifest(frames):
+    manifestFile = Path(renderManifestFile)
+    manifestFile.parent.mkdir(parents=True, exist_ok=True)
+    tempFile = manifestFile.with_name(manifestFile.name + '.tmp')
+    with open(tempFile, 'w') as file:
+        json.dump({'frames': frames}, file, indent=1, sort_keys=True)
+    os.replace(tempFile, manifestFile)
+
+# Returns True if the XML file was already plotted with the current settings and has not changed since
+def is_plot_up_to_date(frames, xml_file, configHash):
+    entry = frames.get(get_xml_file_key(xml_file))
+    if entry is None or entry.get('configHash') != configHash:
+        return False
+    if not is_same_xml_file_signature(entry.get('source'), xml_file):
+        return False
+    outputFiles = entry['output'] if isinstance(entry['output'], list) else [entry['output']]
+    return all(Path(outputFile).exists() for outputFile in outputFiles)
+
+# Records the plots of an XML file in the render manifest, outputFiles is the list returned by plot_xml_file()
+def record_plot(frames, xml_file, outputFiles, configHash):
+    frames[get_xml_file_key(xml_file)] = {'source': get_xml_file_signature(xml_file), 'configHash': configHash,
+                                          'output': [str(outputFile) for outputFile in outputFiles]}
+
+# One row of the report store. Callsigns and locators are stored as ids into the string tables of the store index.
+reportDtype = np.dtype([
+    ('captureTime', 'i8'), # Capture time from the XML file name, in seconds since 1970-01-01 UTC
+    ('flowStartSeconds', 'i8'),
+    ('senderId', 'i4'),
+    ('receiverId', 'i4'),
+    ('senderLocatorId', 'i4'),
+    ('receiverLocatorId', 'i4'),
+    ('frequency', 'i8'),
+    ('snr', 'i2'),
+    ('senderLon', 'f4'),
+    ('senderLat', 'f4'),
+    ('receiverLon', 'f4'),
+    ('receiverLat', 'f4'),
+])
+
+# Converts a naive UTC datetime (like the ones from get_time_from_xml) to seconds since 1970-01-01 UTC and back.
+# An aware datetime is converted with its own offset.
+def datetime_to_seconds(thisDateTime):
+    if thisDateTime.tzinfo is not None:
+        return int(thisDateTime.timestamp())
+    return int(thisDateTime.replace(tzinfo=timezone.utc).timestamp())
+
+def seconds_to_datetime(seconds):
+    return datetime.fromtimestamp(int(seconds), timezone.utc).replace(tzinfo=None)
+
+# Parses a date/time option like 2025-07-01T12:00 into a naive UTC datetime like the XML file names.
+# A time with an offset (2025-07-01T14:00+02:00) or Z is converted to UTC.
+def parse_utc_datetime(value):
+    thisDateTime = datetime.fromisoformat(value)
+    if thisDateTime.tzinfo is not None:
+        thisDateTime = thisDateTime.astimezone(timezone.utc).replace(tzinfo=None)
+    return thisDateTime
+
+# Loads the report store index: the list of ingested captures (name, time, first row, row count and the signature of the
+# XML file) and the string tables
+def load_report_store_index():
+    try:
+        with open(Path(reportStoreDir) / 'index.json', 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'captures': [], 'callsigns': [], 'locators': []}
+
+def save_report_store_index(index):
+    indexFile = Path(reportStoreDir) / 'index.json'
+    tempFile = indexFile.with_name(indexFile.name + '.tmp')
+    with open(tempFile, 'w') as file:
+        json.dump(index, file)
+    os.replace(tempFile, indexFile)
+
+# Returns the id of a string in a string table, adding it if it is new. ids is a dictionary of string to id for the same table.
+def get_string_id(table, ids, value):
+    stringId = ids.get(value)
+    if stringId is None:
+        stringId = ids[value] = len(table)
+        table.append(value)
+    return stringId
+
+# Converts one XML file into an array of reportDtype rows, incomplete reports are skipped.
+# callsigns/locators are the string tables of the store and callsignIds/locatorIds their string to id dictionaries.
+# A file that cannot be read gives no rows, or raises the error with skipErrors=False.
+@timed_stage('read_records')
+def records_from_xml_file(xml_file, callsigns, callsignIds, locators, locatorIds, skipErrors=True):
+    captureTime = datetime_to_seconds(get_time_from_xml(xml_file))
+    rows = []
+    parsed = 0
+    for report in iter_xml_reports([xml_file], skipErrors=skipErrors):
+        parsed += 1
+        callsign, frequency, senderLocator, receiverLocator, signal_strength = get_report_attributes(report)
+        if not is_complete_report(callsign, frequency, senderLocator, receiverLocator, signal_strength):
+            continue
+        receiverCallsign = report.attrib.get('receiverCallsign', 'N/A')
+        try:
+            flowStartSeconds = int(report.attrib.get('flowStartSeconds', captureTime))
+        except ValueError as e:
+            print(f"Invalid attribute in report: {e}, result discarded.")
+            continue
+        rows.append((captureTime, flowStartSeconds,
+                     get_string_id(callsigns, callsignIds, callsign), get_string_id(callsigns, callsignIds, receiverCallsign),
+                     get_string_id(locators, locatorIds, senderLocator), get_string_id(locators, locatorIds, receiverLocator),
+                     frequency, signal_strength, 0, 0, 0, 0))
+    count_stat('reports_parsed', parsed)
+    count_stat('reports_skipped', parsed - len(rows))
+
+    records = np.array(rows, dtype=reportDtype)
+    if len(records):
+        # Decode each locator once through the locator table
+        locatorArray = np.asarray(locators)
+        senderCoords = get_lat_lon_from_locators(locatorArray[records['senderLocatorId']])
+        receiverCoords = get_lat_lon_from_locators(locatorArray[records['receiverLocatorId']])
+        records['senderLon'], records['senderLat'] = senderCoords[:, 0], senderCoords[:, 1]
+        records['receiverLon'], records['receiverLat'] = receiverCoords[:, 0], receiverCoords[:, 1]
+    return records
+
+# Returns the number of rows in the report store file that belong to a capture. Rows of captures that were ingested again
+# after their XML file changed are left in the file, unused, so this is the end of the last capture rather than a sum.
+def get_report_store_rows(index):
+    return max((capture['start'] + capture['count'] for capture in index['captures']), default=0)
+
+# Converts XML files that are not in the report store yet, or that changed since they were ingested, and appends them to
+# it. Files that cannot be parsed are left out and tried again on the next run. Returns the number of reports added.
+def ingest_xml_files(xml_files):
+    storeDir = Path(reportStoreDir)
+    storeDir.mkdir(parents=True, exist_ok=True)
+    dataFile = storeDir / 'reports.bin'
+    index = load_report_store_index()
+    callsigns, locators = index['callsigns'], index['locators']
+    callsignIds = {value: stringId for stringId, value in enumerate(callsigns)}
+    locatorIds = {value: stringId for stringId, value in enumerate(locators)}
+    ingested = {capture['name']: capture for capture in index['captures']}
+
+    # Drop rows left behind by an ingest that was interrupted before the index was saved
+    rowCount = get_report_store_rows(index)
+    with open(dataFile, 'ab') as file:
+        file.truncate(rowCount * reportDtype.itemsize)
+
+    def is_ingested(xml_file):
+        capture = ingested.get(xml_file.name)
+        return capture is not None and is_same_xml_file_signature(capture['source'], xml_file)
+
+    added = 0
+    newFiles = sorted((xml_file for xml_file in xml_files if not is_ingested(xml_file)), key=get_time_from_xml)
+    with open(dataFile, 'ab') as file:
+        for xml_file in newFiles:
+            try:
+                records = records_from_xml_file(xml_file, callsigns, callsignIds, locators, locatorIds, skipErrors=False)
+            except (ET.ParseError, EOFError, zlib.error, gzip.BadGzipFile, OSError) as e:
+                # Empty or truncated cron captures, or files still being written, are tried again on the next run
+                print(f"Could not read {xml_file}: {e}, it will be ingested on the next run.")
+                continue
+            file.write(records.tobytes())
+            # A changed file replaces its earlier capture, the old rows are no longer referenced
+            if xml_file.name in ingested:
+                index['captures'].remove(ingested[xml_file.name])
+            capture = {'name': xml_file.name, 'time': datetime_to_seconds(get_time_from_xml(xml_file)),
+                       'start': rowCount, 'count': len(records), 'source': get_xml_file_signature(xml_file)}
+            index['captures'].append(capture)
+            ingested[xml_file.name] = capture
+            rowCount += len(records)
+            added += len(records)
+
+    index['captures'].sort(key=lambda capture: capture['time'])
+    save_report_store_index(index)
+    return added
+
+# Returns the rows of the report store captured between start and end (naive UTC datetimes, None for no limit).
+# The store is memory mapped, when the captures in the range were ingested in order the result is a view into the file
+# and nothing is copied.
+@timed_stage('read_records')
+def load_report_store(start=None, end=None):
+    index = load_report_store_index()
+    dataFile = Path(reportStoreDir) / 'reports.bin'
+    rowCount = get_report_store_rows(index)
+    if rowCount == 0 or not dataFile.exists():
+        return np.empty(0, dtype=reportDtype), index
+    store = np.memmap(dataFile, dtype=reportDtype, mode='r', shape=(rowCount,))
+
+    startSeconds = datetime_to_seconds(start) if start is not None else None
+    endSeconds = datetime_to_seconds(end) if end is not None else None
+    ranges = []
+    for capture in index['captures']:
+        if (startSeconds is not None and capture['time'] < startSeconds) or (endSeconds is not None and capture['time'] > endSeconds):
+            continue
+        # Merge captures that follow each other in the file into one slice
+        if ranges and ranges[-1][1] == capture['start']:
+            ranges[-1][1] += capture['count']
+        else:
+            ranges.append([capture['start'], capture['start'] + capture['count']])
+
+    if not ranges:
+        return np.empty(0, dtype=reportDtype), index
+    if len(ranges) == 1:
+        return store[ranges[0][0]:ranges[0][1]], index
+    return np.concatenate([store[first:last] for first, last in ranges]), index
+
+# Plots rows from the report store onto the map in one batch, same as plot_reception_reports() for XML reports
+def plot_report_records(ax, records, index):
+    locatorArray = np.asarray(index['locators'])
+    senderCoords = np.column_stack([records['senderLon'], records['senderLat']])
+    receiverCoords = np.column_stack([records['receiverLon'], records['receiverLat']])
+    plot_signal_paths(ax, senderCoords, receiverCoords, records['frequency'], records['snr'],
+                      locatorArray[records['senderLocatorId']], locatorArray[records['receiverLocatorId']])
+    plot_qth_locators(ax, receiverCoords)
+
+# Report store version of split_reports_by_station(), splits rows by receiving station with one pass over the rows.
+# Returns a list of (station callsign, rows), or [(None, records)] when only one station is configured.
+def split_records_by_station(records, index):
+    stations = get_frame_stations()
+    if stations == [None]:
+        return [(None, records)]
+    # Station number of every callsign id, -1 for receivers that are not one of the stations
+    stationNumbers = np.full(len(index['callsigns']), -1)
+    for callsignId, callsign in enumerate(index['callsigns']):
+        if callsign.upper() in stations:
+            stationNumbers[callsignId] = stations.index(callsign.upper())
+    rowStations = stationNumbers[records['receiverId']] if len(records) else np.empty(0, dtype=int)
+    order = np.argsort(rowStations, kind='stable')
+    bounds = np.searchsorted(rowStations[order], np.arange(len(stations) + 1), side='left')
+    return [(station, records[order[bounds[number]:bounds[number + 1]]]) for number, station in enumerate(stations)]
+
+# Returns the bandPlan index for a band name like '20m', raises ValueError for unknown bands
+def get_band_index(bandName):
+    for bandIndex, (lowerEdge, name, color) in enumerate(bandPlan):
+        if name.lower() == bandName.strip().lower():
+            return bandIndex
+    raise ValueError(f"Unknown band: {bandName}. Use one of: {', '.join(name for _, name, _ in bandPlan)}")
+
+# Checks a --band option, so an unknown band is reported before any report is read
+def parse_band(bandName):
+    try:
+        get_band_index(bandName)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return bandName
+
+# Returns the XML files sorted by capture time as a list of (capture datetime, XML file).
+# Only the file names are read, no file is opened.
+def build_capture_index(xml_files):
+    captureIndex = []
+    for xml_file in xml_files:
+        try:
+            captureIndex.append((get_time_from_xml(xml_file), xml_file))
+        except (IndexError, ValueError):
+            print(f"Could not read the capture time from the file name {xml_file}, file skipped.")
+    captureIndex.sort(key=lambda capture: capture[0])
+    return captureIndex
+
+# Returns the XML files from a capture index captured between start and end (naive UTC datetimes, None for no limit)
+def select_captures(captureIndex, start=None, end=None):
+    times = [captureTime for captureTime, _ in captureIndex]
+    first = bisect_left(times, start) if start is not None else 0
+    last = bisect_right(times, end) if end is not None else len(times)
+    return [xml_file for _, xml_file in captureIndex[first:last]]
+
+# Filters report store rows by band names, minimum SNR and sender callsigns (None for no filter)
+def filter_report_records(records, index, bands=None, minSnr=None, callsigns=None):
+    keep = np.ones(len(records), dtype=bool)
+    if bands:
+        keep &= np.isin(get_band_indices(records['frequency']), [get_band_index(band) for band in bands])
+    if minSnr is not None:
+        keep &= records['snr'] >= minSnr
+    if callsigns:
+        wanted = {callsign.strip().upper() for callsign in callsigns}
+        keep &= np.isin(records['senderId'], [callsignId for callsignId, callsign in enumerate(index['callsigns']) if callsign.upper() in wanted])
+    return records if keep.all() else records[keep]
+
+# Returns the reception reports between start and end (naive UTC datetimes) as report store rows, filtered like
+# filter_report_records(), together with the string tables they refer to.
+# Reads the report store when useStore is set, otherwise only the XML files whose file name falls in the time range are opened.
+def query_reports(start=None, end=None, bands=None, minSnr=None, callsigns=None, useStore=False):
+    # Check the band names before reading anything
+    for band in bands or []:
+        get_band_index(band)
+
+    if useStore:
+        records, index = load_report_store(start, end)
+    else:
+        xmlFiles = select_captures(build_capture_index(get_xml_files()), start, end)
+        index = {'captures': [], 'callsigns': [], 'locators': []}
+        callsignIds, locatorIds = {}, {}
+        fileRecords = []
+        rowCount = 0
+        for xml_file in xmlFiles:
+            records = records_from_xml_file(xml_file, index['callsigns'], callsignIds, index['locators'], locatorIds)
+            fileRecords.append(records)
+            index['captures'].append({'name': xml_file.name, 'time': datetime_to_seconds(get_time_from_xml(xml_file)),
+                                      'start': rowCount, 'count': len(records)})
+            rowCount += len(records)
+        records = np.concatenate(fileRecords) if fileRecords else np.empty(0, dtype=reportDtype)
+
+    return filter_report_records(records, index, bands, minSnr, callsigns), index
+
+# Bins reports into a longitude/latitude grid. Returns a dictionary with the cell edges and the report count, best SNR and
+# median SNR of each cell as (latitude cells, longitude cells) arrays. Cells without reports have a count of 0 and NaN
+# SNR values.
+@timed_stage('heatmap')
+def aggregate_reports_grid(lons, lats, snrs, cellLon=None, cellLat=None):
+    cellLon = heatmapCellLon if cellLon is None else cellLon
+    cellLat = heatmapCellLat if cellLat is None else cellLat
+    lonEdges = np.arange(-180, 180 + cellLon / 2, cellLon)
+    latEdges = np.arange(-90, 90 + cellLat / 2, cellLat)
+    lonCells, latCells = len(lonEdges) - 1, len(latEdges) - 1
+
+    lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+    valid = np.isfinite(lons) & np.isfinite(lats)
+    lonIndex = np.clip(((lons[valid] + 180) // cellLon).astype(int), 0, lonCells - 1)
+    latIndex = np.clip(((lats[valid] + 90) // cellLat).astype(int), 0, latCells - 1)
+    cells = latIndex * lonCells + lonIndex
+    cellSnrs = np.asarray(snrs, dtype=float)[valid]
+
+    cellCount = latCells * lonCells
+    count = np.bincount(cells, minlength=cellCount)
+    best = np.full(cellCount, np.nan)
+    median = np.full(cellCount, np.nan)
+    if len(cells):
+        # Sort by cell then SNR, each cell is then a run of sorted SNR values
+        order = np.lexsort((cellSnrs, cells))
+        cells, cellSnrs = cells[order], cellSnrs[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+        ends = np.r_[starts[1:], len(cells)]
+        best[cells[starts]] = cellSnrs[ends - 1]
+        sizes = ends - starts
+        median[cells[starts]] = (cellSnrs[starts + (sizes - 1) // 2] + cellSnrs[starts + sizes // 2]) / 2
+
+    shape = (latCells, lonCells)
+    return {'lonEdges': lonEdges, 'latEdges': latEdges,
+            'count': count.reshape(shape), 'best': best.reshape(shape), 'median': median.reshape(shape)}
+
+# Draws an aggregate_reports_grid() result as a single pcolormesh layer with a color bar.
+# metric is 'count', 'best' or 'median'. The drawing cost depends on the grid size only, not on the number of reports.
+@timed_stage('heatmap')
+def plot_heatmap(ax, grid, metric='count'):
+    count = grid['count']
+    values = np.ma.masked_where(count == 0, grid[metric])
+    if metric == 'count':
+        colorScale = dict(cmap='viridis', norm=LogNorm(vmin=1, vmax=max(count.max(), 2)))
+        label = 'Reports per grid square'
+    else:
+        colorScale = dict(cmap='RdYlGn', vmin=-23, vmax=10)
+        label = f"{'Best' if metric == 'best' else 'Median'} SNR (dB)"
+
+    mesh = ax.pcolormesh(grid['lonEdges'], grid['latEdges'], values, transform=ccrs.PlateCarree(), alpha=0.8, zorder=2, **colorScale)
+    ax.figure.colorbar(mesh, ax=ax, orientation='horizontal', shrink=0.5, pad=0.03, label=label)
+    return mesh
+
+# Plots report store rows as a heatmap of the sender locations. All rows are combined into one layer, filter them by band
+# first (see filter_report_records()) for a heatmap of one band.
+def plot_report_heatmap(ax, records, metric='count'):
+    grid = aggregate_reports_grid(records['senderLon'], records['senderLat'], records['snr'])
+    plot_heatmap(ax, grid, metric)
+    plot_qth_locators(ax, np.column_stack([records['receiverLon'], records['receiverLat']]))